@@ -1,11 +1,5 @@
 #!/bin/bash
 
-# get data and store in database
-python -m customer_recommender.ingest.yelp
-
-# creates clusters
-python -m customer_recommender.wrangle.cluster_data
-
-# launches Flask app
-python customer_recommender/visualize/app.py 
-
+# get data and store in database, then create clusters, skipping the stages
+# that are up to date, and launch the Flask app
+python -m customer_recommender.cli pipeline --serve "$@"
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks the per-user aggregation of the wrangle step on a synthetic review frame.
+
+    $ python -m customer_recommender.benchmark.aggregate 1000000 50000
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from customer_recommender.wrangle.cluster_data import summarize_users, create_user_df
+
+WORDS = ['burger', 'fries', 'pizza', 'sushi', 'brunch', 'coffee', 'wine', 'spicy', 'great', 'service']
+
+
+def synthetic_reviews(n_reviews=1000000, n_users=50000, seed=2):
+
+    """Builds a random review frame shaped like the raw dataframe.
+
+    Args:
+        n_reviews (int): Number of reviews
+        n_users (int): Number of distinct users, picked with a long tailed distribution
+        seed (int): Seed of the random generator
+    Returns:
+        df (pandas.DataFrame): Reviews with the user, review, date, rating and restaurant columns.
+    """
+
+    rng = np.random.RandomState(seed)
+    users = np.array(['/user_details?userid={0:07d}'.format(i) for i in range(n_users)], dtype=object)
+    texts = np.array([' '.join(rng.choice(WORDS, 8)) + '. ' for _ in range(1000)], dtype=object)
+    dates = pd.date_range('2010-01-01', periods=2000).strftime('%Y-%m-%d')
+    return pd.DataFrame({
+        'user': users[np.minimum(rng.zipf(1.5, n_reviews), n_users) - 1],
+        'review': texts[rng.randint(0, len(texts), n_reviews)],
+        'date': np.asarray(dates, dtype=object)[rng.randint(0, len(dates), n_reviews)],
+        'rating': rng.randint(1, 6, n_reviews).astype(float),
+        'restaurant': rng.randint(0, 5000, n_reviews).astype(str),
+    }, columns=['user', 'review', 'date', 'rating', 'restaurant'])
+
+
+def legacy_user_reviews(df, users):
+    """The former create_user_df loop: one boolean mask over the frame per user"""
+
+    reviews = []
+    for user in users:
+        text = ''
+        for review in df[df['user'] == user]['review'].tolist():
+            text += review
+        reviews.append(text)
+    return reviews
+
+
+def main(n_reviews=1000000, n_users=50000, sample=50):
+    df = synthetic_reviews(n_reviews, n_users)
+    print "{0} reviews, {1} users".format(len(df), df['user'].nunique())
+
+    start_time = time.time()
+    summary = summarize_users(df)
+    user_df = create_user_df(df, summary)
+    grouped = time.time() - start_time
+
+    # the legacy loop is timed on a sample of the top users and extrapolated
+    users = user_df['user'].tolist()
+    sampled = users[::max(len(users) // sample, 1)][:sample]
+    start_time = time.time()
+    expected = legacy_user_reviews(df, sampled)
+    legacy = (time.time() - start_time) * len(users) / max(len(sampled), 1)
+
+    actual = user_df.set_index('user')['reviews'].loc[sampled].tolist()
+    print "{0} top users".format(len(users))
+    print "  grouped: {0:8.2f} s".format(grouped)
+    print "   legacy: {0:8.2f} s (extrapolated from {1} users)".format(legacy, len(sampled))
+    print "  speedup: {0:8.1f}x  {1}".format(legacy / grouped, 'identical' if actual == expected else 'DIFFERENT')
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
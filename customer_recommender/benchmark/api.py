@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Measures the latency of the users endpoint of the web app on synthetic clustered users,
+through the Flask test client, next to a scan of every row as the page used to filter:
+
+    $ python -m customer_recommender.benchmark.api --users 100000 --queries 2000
+
+The queries follow the page: the slider and checkbox values it can send, the first page
+of users at the default limit of the endpoint after every filter change, and sometimes
+the next pages. The artifact of the users is written to a temporary directory. Every
+mode reports the p50, p99 and maximum latency of the same random queries, the 'every
+page' mode times fetching all the users of a filter, as the page did before it paged.
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from customer_recommender.visualize.app import create_app
+from customer_recommender.visualize.users import DEFAULT_LIMIT, MAX_LIMIT, UserIndex
+from customer_recommender.wrangle.artifact import write_artifact
+
+
+def synthetic_users(n_users=100000, n_clusters=10, seed=2):
+
+    """Builds random clustered users, in the order of clean_df.
+
+    Args:
+        n_users (int): Number of users
+        n_clusters (int): Number of clusters
+        seed (int): Seed of the random generator
+    Returns:
+        df (pandas.DataFrame): The user, last_review_date, avg_rating, num_reviews, cluster and
+            cluster_name of every user.
+    """
+
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        'user': ['www.yelp.com/user_details?userid={0:08d}'.format(i) for i in range(n_users)],
+        'last_review_date': ['2015-{0:02d}-{1:02d}'.format(m, d) for m, d in
+                             zip(rng.randint(1, 13, n_users), rng.randint(1, 29, n_users))],
+        'avg_rating': np.round(rng.uniform(1, 5, n_users), 2),
+        'num_reviews': np.minimum(rng.zipf(1.8, n_users) + 5, 500),
+        'cluster': rng.randint(1, n_clusters + 1, n_users),
+    })
+    df['cluster_name'] = 'cluster ' + df['cluster'].astype(str)
+    return df.sort_values(by=['cluster', 'avg_rating', 'num_reviews'], ascending=[True, False, False])
+
+
+def random_queries(n_queries, n_clusters=10, seed=3):
+    """Function to draw random page requests, the filters of the sliders and checkboxes and the page shown"""
+
+    rng = np.random.RandomState(seed)
+    queries = []
+    for _ in range(n_queries):
+        clusters = sorted(rng.choice(np.arange(1, n_clusters + 1), rng.randint(1, n_clusters + 1), replace=False))
+        queries.append({
+            # the steps of the rating and the review sliders
+            'min_rating': round(rng.randint(0, 101) * .05, 2),
+            'min_reviews': int(rng.randint(5, 101)),
+            'clusters': ','.join(str(c) for c in clusters),
+            'sort': 'rating',
+            # most filter changes only show the first page
+            'offset': int(rng.geometric(.7) - 1) * DEFAULT_LIMIT,
+        })
+    return queries
+
+
+def scan(rows, query):
+    # every row is tested, then the matches are sorted, as the page did before the endpoint
+    clusters = [int(c) for c in query['clusters'].split(',')]
+    matches = [row for row in rows if row['avg_rating'] >= query['min_rating']
+               and row['num_reviews'] >= query['min_reviews'] and row['cluster'] in clusters]
+    key = 'avg_rating' if query['sort'] == 'rating' else 'num_reviews'
+    matches.sort(key=lambda row: row[key], reverse=True)
+    return json.dumps({'total': len(matches), 'users': matches[query['offset']:query['offset'] + DEFAULT_LIMIT]})
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1000
+    return {'p50_ms': np.percentile(latencies, 50), 'p99_ms': np.percentile(latencies, 99),
+            'max_ms': latencies.max(), 'requests': len(latencies)}
+
+
+def measure(function, queries):
+
+    """Times a function on every query.
+
+    Args:
+        function (function): Called with each query
+        queries (list): The queries
+    Returns:
+        stats (dict): The p50, p99 and max latency in milliseconds and the number of requests.
+    """
+
+    latencies = []
+    for query in queries:
+        start_time = time.time()
+        function(query)
+        latencies.append(time.time() - start_time)
+    return percentiles(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the latency of the users endpoint')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--clusters', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    df = synthetic_users(args.users, args.clusters, args.seed)
+    directory = tempfile.mkdtemp()
+    try:
+        write_artifact(df, directory)
+        start_time = time.time()
+        index = UserIndex.load(directory)
+        print "{0} users loaded in {1:.2f}s".format(len(index), time.time() - start_time)
+
+        client = create_app(artifact_dir=directory).test_client()
+        # the first request loads the index of the app
+        client.get('/api/users')
+        queries = random_queries(args.queries, args.clusters, args.seed + 1)
+        rows = df.to_dict('records')
+        etags = {}
+
+        def request(query):
+            response = client.get('/api/users', query_string=query)
+            etags[json.dumps(query, sort_keys=True)] = response.headers['ETag']
+
+        def revalidate(query):
+            client.get('/api/users', query_string=query,
+                       headers={'If-None-Match': etags[json.dumps(query, sort_keys=True)]})
+
+        def every_page(query):
+            offset, total = 0, None
+            while total is None or offset < total:
+                page = json.loads(client.get('/api/users', query_string=dict(
+                    query, offset=offset, limit=MAX_LIMIT)).data)
+                total = page['total']
+                if not page['users']:
+                    break
+                offset += len(page['users'])
+
+        results = [
+            ('scan', measure(lambda query: scan(rows, query), queries)),
+            ('index', measure(lambda query: index.query(**dict(query, clusters=[
+                int(c) for c in query['clusters'].split(',')])), queries)),
+            ('endpoint', measure(request, queries)),
+            ('endpoint 304', measure(revalidate, queries)),
+            ('every page', measure(every_page, [query for query in queries if not query['offset']])),
+        ]
+        for name, stats in results:
+            print "{0:>14}: p50 {p50_ms:8.3f} ms  p99 {p99_ms:8.3f} ms  max {max_ms:8.3f} ms  ({requests} queries)".format(
+                name, **stats)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
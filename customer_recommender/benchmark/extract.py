@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks the review extractor backends on saved review pages.
+
+Pages are read from *.html files and from the review pages of the response cache:
+
+    $ python -m customer_recommender.benchmark.extract output/cache saved_pages/
+"""
+
+import os
+import sys
+import glob
+import time
+from customer_recommender.cache import ResponseCache
+from customer_recommender.ingest.extract import EXTRACTORS, get_extractor
+
+
+def load_pages(paths):
+
+    """Loads saved review pages.
+
+    Args:
+        paths (list): Directories of *.html files or response cache directories
+    Returns:
+        pages (list): The html of every page found.
+    """
+
+    pages = []
+    for path in paths:
+        html_files = sorted(glob.glob(os.path.join(path, '*.html')))
+        if html_files:
+            for html_file in html_files:
+                with open(html_file, 'rb') as infile:
+                    pages.append(infile.read().decode('utf-8'))
+        else:
+            pages.extend(text for url, text in ResponseCache(path).items(resource='page'))
+    return pages
+
+
+def time_extractor(name, pages, repeat=3):
+
+    """Times the extraction of the reviews of every page with one backend.
+
+    Args:
+        name (str): The name of the extractor backend
+        pages (list): The html of the pages
+        repeat (int): Number of runs, the fastest one is kept
+    Returns:
+        seconds (float): The fastest time to extract all the pages.
+        reviews (list): The reviews extracted from each page.
+    """
+
+    extractor = get_extractor(name)
+    best = None
+    for _ in range(repeat):
+        start_time = time.time()
+        reviews = [extractor.get_reviews(page) for page in pages]
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, reviews
+
+
+def main(paths):
+    pages = load_pages(paths)
+    if not pages:
+        print "No saved pages found in {0}".format(', '.join(paths))
+        return
+
+    results = {}
+    for name in sorted(EXTRACTORS):
+        results[name] = time_extractor(name, pages)
+
+    baseline, expected = results['bs4']
+    n_reviews = sum(len(reviews) for reviews in expected)
+    print "{0} pages, {1} reviews".format(len(pages), n_reviews)
+    for name, (seconds, reviews) in sorted(results.items()):
+        print "{0:>5}: {1:8.2f} ms/page  {2:6.2f}x  {3}".format(
+            name, 1000.0 * seconds / len(pages), baseline / seconds,
+            'identical' if reviews == expected else 'DIFFERENT')
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or [os.path.join('output', 'cache')])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Compares the time and peak memory of the feature paths of the clustering on synthetic
+user corpora, every path runs in its own process so its peak RSS is measured alone:
+
+    $ python -m customer_recommender.benchmark.features 5000 2000
+"""
+
+import sys
+import time
+import resource
+import multiprocessing
+import numpy as np
+from customer_recommender.wrangle.features import HashingFeatures
+
+
+def synthetic_documents(n_users=5000, n_tokens=2000, vocabulary=50000, seed=2):
+
+    """Builds random pre-tokenized user corpora with a long tailed vocabulary.
+
+    Args:
+        n_users (int): Number of user corpora
+        n_tokens (int): Number of stems per corpus
+        vocabulary (int): Number of distinct stems
+        seed (int): Seed of the random generator
+    Returns:
+        documents (list): The stems of each corpus.
+    """
+
+    rng = np.random.RandomState(seed)
+    words = ['w{0}'.format(i) for i in range(vocabulary)]
+    return [[words[i] for i in np.minimum(rng.zipf(1.3, n_tokens), vocabulary) - 1] for _ in range(n_users)]
+
+
+def _build(name, documents):
+    if name == 'tfidf':
+        from customer_recommender.wrangle.cluster_data import build_tfidf_matrix
+        return build_tfidf_matrix([(None, document) for document in documents], [])[1]
+    if name == 'hashing':
+        return HashingFeatures().fit_transform(documents)
+    return HashingFeatures(svd_components=100).fit_transform(documents)
+
+
+def _measure(name, documents, results):
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.time()
+    matrix = _build(name, documents)
+    elapsed = time.time() - start_time
+    # ru_maxrss is in kilobytes on Linux
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 1024.0
+    results.put((elapsed, peak, matrix.shape))
+
+
+def measure(name, documents):
+
+    """Builds the features of one path in a child process.
+
+    Args:
+        name (str): 'tfidf', 'hashing' or 'hashing+svd'
+        documents (list): The stems of each corpus
+    Returns:
+        seconds (float): The time to build the feature matrix.
+        peak (float): The growth of the peak RSS while building it (in MB).
+        shape (tuple): The shape of the feature matrix.
+    """
+
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(name, documents, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main(n_users=5000, n_tokens=2000):
+    documents = synthetic_documents(n_users, n_tokens)
+    print "{0} users, {1} stems each".format(n_users, n_tokens)
+    baseline = None
+    for name in ('tfidf', 'hashing', 'hashing+svd'):
+        seconds, peak, shape = measure(name, documents)
+        baseline = baseline or (seconds, peak)
+        print "{0:>12}: {1:8.2f} s ({2:5.2f}x)  {3:8.1f} MB peak ({4:5.2f}x)  {5} x {6}".format(
+            name, seconds, seconds / baseline[0], peak, peak / max(baseline[1], 1e-9), shape[0], shape[1])
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+Measures the import time of the entry points of the package, every import runs in a
+fresh interpreter so nothing is already loaded:
+
+    $ python -m customer_recommender.benchmark.imports --repeat 5 --output output/imports.json
+
+For every module it reports the median import time, the wall time of the whole process,
+the heavy libraries the import loaded and the threads it started (a MongoDB client
+starts monitor threads as soon as it is created).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from customer_recommender.helper import create_dir
+
+MODULES = [
+    'customer_recommender.cli',
+    'customer_recommender.config',
+    'customer_recommender.pipeline',
+    'customer_recommender.ingest.yelp',
+    'customer_recommender.wrangle.cluster_data',
+    'customer_recommender.visualize.app',
+]
+
+HEAVY = ('pandas', 'numpy', 'scipy', 'sklearn', 'nltk', 'pymongo', 'flask', 'bs4', 'lxml', 'requests')
+
+PROBE = """
+import sys, json, time, threading
+start = time.time()
+import {module}
+seconds = time.time() - start
+sys.stdout.write(json.dumps({{'seconds': seconds, 'threads': threading.active_count(), 'modules': len(sys.modules),
+                             'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def probe(module):
+
+    """Imports a module in a fresh interpreter.
+
+    Args:
+        module (str): The dotted name of the module
+    Returns:
+        result (dict): The import seconds, the process wall seconds, the number of modules and threads
+            after the import and the heavy libraries it loaded.
+    Raises:
+        RuntimeError: The import failed, with its output.
+    """
+
+    start_time = time.time()
+    process = subprocess.Popen([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    wall = time.time() - start_time
+    if process.returncode != 0:
+        raise RuntimeError('import {0} failed:\n{1}'.format(module, err))
+    result = json.loads(out)
+    result['wall_seconds'] = wall
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def measure(module, repeat=5):
+
+    """Imports a module repeat times, each time in a fresh interpreter.
+
+    Args:
+        module (str): The dotted name of the module
+        repeat (int): Number of imports
+    Returns:
+        stats (dict): The median seconds and wall_seconds, and the modules, threads and heavy libraries
+            of the last import, or the error of the import.
+    """
+
+    runs = []
+    for _ in range(repeat):
+        try:
+            runs.append(probe(module))
+        except RuntimeError as e:
+            return {'error': str(e)}
+    stats = dict(runs[-1])
+    stats['seconds'] = median([run['seconds'] for run in runs])
+    stats['wall_seconds'] = median([run['wall_seconds'] for run in runs])
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the import time of the package entry points')
+    parser.add_argument('modules', nargs='*', help='modules to import (default: the entry points)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args(argv)
+
+    # the interpreter startup alone, part of the process time of every module
+    startup = median([probe('os')['wall_seconds'] for _ in range(args.repeat)])
+    print "{0:>42}: {1:8.3f} s".format('interpreter startup', startup)
+    results = {}
+    for module in args.modules or MODULES:
+        stats = results[module] = measure(module, args.repeat)
+        if 'error' in stats:
+            print "{0:>42}: {1}".format(module, stats['error'].strip().splitlines()[-1])
+            continue
+        print "{0:>42}: {1:8.3f} s import {2:8.3f} s process {3:5d} modules {4:3d} threads  {5}".format(
+            module, stats['seconds'], stats['wall_seconds'], stats['modules'], stats['threads'],
+            ', '.join(stats['loaded']) or '-')
+
+    if args.output:
+        if os.path.dirname(args.output):
+            create_dir(os.path.dirname(args.output))
+        with open(args.output, 'w') as outfile:
+            json.dump({'timestamp': time.time(), 'python': sys.version.split()[0], 'repeat': args.repeat,
+                       'startup_seconds': startup, 'modules': results}, outfile, indent=2, sort_keys=True)
+        print "Results saved to {0}".format(args.output)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
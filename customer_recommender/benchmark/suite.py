@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+"""
+Times every stage of the pipeline on a synthetic corpus and measures its peak memory,
+the results are written as JSON so that runs can be compared:
+
+    $ python -m customer_recommender.benchmark.suite --users 2000 --output output/benchmark.json
+    $ python -m customer_recommender.benchmark.suite --users 2000 --compare output/benchmark.json
+
+Every stage runs in a forked process, so its peak RSS is measured on its own. The
+get_raw_dataframe stage reads from a scratch collection of the MongoDB server given
+with --mongo, or from mongomock when it is installed, and is skipped otherwise.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import traceback
+import multiprocessing
+from customer_recommender.helper import create_dir
+from customer_recommender.benchmark.synthetic import SyntheticCorpus
+from customer_recommender.ingest.extract import get_extractor
+
+
+def _run(function, args, results):
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_cpu = time.clock()
+    start_time = time.time()
+    try:
+        value = function(*args)
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+        return
+    stats = {
+        'seconds': time.time() - start_time,
+        'cpu_seconds': time.clock() - start_cpu,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 1024.0,
+    }
+    results.put((stats, value))
+
+
+def run_stage(function, *args):
+
+    """Runs a stage in a forked process.
+
+    Args:
+        function (function): The stage
+        args: The arguments of the stage
+    Returns:
+        stats (dict): The seconds, cpu_seconds and peak_mb (growth of the peak RSS) of the stage.
+        value: The return value of the stage.
+    Raises:
+        RuntimeError: The stage raised, with its traceback.
+    """
+
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(function, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    if isinstance(result, dict):
+        raise RuntimeError(result['error'])
+    return result
+
+
+def get_collection(corpus, mongo=None):
+    """Function to load the synthetic businesses into a scratch collection, or None without a database"""
+
+    if mongo:
+        from pymongo import MongoClient
+        collection = MongoClient(mongo).benchmark.businesses
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            return None
+        collection = mongomock.MongoClient().benchmark.businesses
+    collection.drop()
+    collection.insert_many([dict(business) for business in corpus.businesses()])
+    return collection
+
+
+def stage_user_df(df):
+    from customer_recommender.wrangle.cluster_data import summarize_users, create_user_df
+    summary = summarize_users(df)
+    return summary, create_user_df(df, summary)
+
+
+def stage_tokenize(reviews, workers):
+    from customer_recommender.wrangle.tokens import StemIndex, tokenize_corpora
+    stem_index = StemIndex()
+    return stem_index, tokenize_corpora(reviews, workers=workers, index=stem_index)
+
+
+def stage_features(tokenized, features):
+    from nltk.corpus import stopwords
+    from customer_recommender.wrangle.cluster_data import build_features, get_stop_words
+    return build_features(tokenized, get_stop_words(stopwords.words('english')), features)
+
+
+def stage_kmeans(matrix, num_clusters, engine):
+    from customer_recommender.wrangle.clustering import fit_clusters
+    return fit_clusters(matrix, num_clusters, engine=engine)
+
+
+def stage_clean_df(df, km, users, summary, reviews, stem_index, vectorizer):
+    from customer_recommender.wrangle.cluster_data import clean_df, get_cluster_words_dict
+    from customer_recommender.wrangle.features import term_centers
+    cluster_words_dict = get_cluster_words_dict(reviews, stem_index, km, km.n_clusters, vectorizer.get_feature_names(),
+                                                term_centers(vectorizer, km.cluster_centers_))
+    return clean_df(df, cluster_words_dict, km, users, summary)
+
+
+def stage_extract(name, pages):
+    extractor = get_extractor(name)
+    return sum(len(extractor.get_reviews(page)) for page in pages)
+
+
+def run_suite(corpus, features='tfidf', engine='kmeans', num_clusters=10, workers=1, mongo=None):
+
+    """Runs every stage of the pipeline on a synthetic corpus.
+
+    Args:
+        corpus (SyntheticCorpus): The synthetic corpus
+        features (str): The feature path, 'tfidf' or 'hashing'
+        engine (str): The clustering engine, 'kmeans' or 'minibatch'
+        num_clusters (int): Number of clusters
+        workers (int): Number of tokenization processes
+        mongo (str): Optional MongoDB uri of the server holding the scratch collection
+    Returns:
+        stages (dict): The stats of every stage, keyed by stage name.
+    """
+
+    stages = {}
+
+    def record(name, stats, **counts):
+        stats.update(counts)
+        stages[name] = stats
+        print "{0:>20}: {1:8.2f} s {2:8.1f} MB".format(name, stats['seconds'], stats['peak_mb'])
+
+    df = corpus.dataframe()
+    collection = get_collection(corpus, mongo)
+    if collection is None:
+        stages['get_raw_dataframe'] = {'skipped': 'no MongoDB server given and mongomock is not installed'}
+    else:
+        from customer_recommender.wrangle.cluster_data import get_raw_dataframe
+        stats, raw = run_stage(get_raw_dataframe, collection)
+        record('get_raw_dataframe', stats, reviews=len(raw))
+
+    stats, (summary, user_df) = run_stage(stage_user_df, df)
+    record('create_user_df', stats, users=len(user_df))
+    users, reviews = user_df['user'].tolist(), user_df['reviews'].tolist()
+
+    stats, (stem_index, tokenized) = run_stage(stage_tokenize, reviews, workers)
+    record('tokenize', stats, stems=len(stem_index), tokens=sum(len(stems) for tokens, stems in tokenized))
+
+    stats, (vectorizer, matrix) = run_stage(stage_features, tokenized, features)
+    record(features, stats, columns=matrix.shape[1])
+
+    stats, km = run_stage(stage_kmeans, matrix, num_clusters, engine)
+    record(engine, stats, clusters=num_clusters)
+
+    stats, final_df = run_stage(stage_clean_df, df, km, users, summary, reviews, stem_index, vectorizer)
+    record('clean_df', stats, rows=len(final_df))
+
+    pages = corpus.review_pages()
+    for name in ('bs4', 'lxml'):
+        stats, n_reviews = run_stage(stage_extract, name, pages)
+        record('extract_' + name, stats, pages=len(pages), reviews=n_reviews)
+    return stages
+
+
+def compare(stages, previous):
+    """Function to print the ratio of every stage to the stages of a previous run"""
+
+    for name, stats in sorted(stages.items()):
+        before = previous.get(name, {})
+        if 'seconds' in stats and before.get('seconds'):
+            print "{0:>20}: {1:6.2f}x time {2:6.2f}x memory".format(
+                name, stats['seconds'] / before['seconds'], stats['peak_mb'] / max(before.get('peak_mb'), 1e-9))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the pipeline stages on a synthetic corpus')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reviews-per-user', type=int, default=10)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--skew', type=float, default=1.2)
+    parser.add_argument('--seed', type=int, default=2)
+    parser.add_argument('--features', default='tfidf')
+    parser.add_argument('--engine', default='kmeans')
+    parser.add_argument('--clusters', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--mongo', help='MongoDB uri, a scratch benchmark.businesses collection is used')
+    parser.add_argument('--output', default=os.path.join('output', 'benchmark.json'))
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    args = parser.parse_args(argv)
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as infile:
+            previous = json.load(infile)['stages']
+
+    corpus = SyntheticCorpus(n_users=args.users, reviews_per_user=args.reviews_per_user,
+                             vocabulary=args.vocabulary, skew=args.skew, seed=args.seed)
+    stages = run_suite(corpus, features=args.features, engine=args.engine, num_clusters=args.clusters,
+                       workers=args.workers, mongo=args.mongo)
+
+    results = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': dict((k, v) for k, v in vars(args).items() if k not in ('output', 'compare', 'mongo')),
+        'stages': stages,
+    }
+    if os.path.dirname(args.output):
+        create_dir(os.path.dirname(args.output))
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=2, sort_keys=True)
+    print "Results saved to {0}".format(args.output)
+    if previous is not None:
+        print "Compared to {0}:".format(args.compare)
+        compare(stages, previous)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+Seeded generator of Yelp-like businesses, reviews and review pages, so the pipeline
+can be measured without network access or real Yelp data.
+"""
+
+import cgi
+import datetime
+import numpy as np
+import pandas as pd
+
+SYLLABLES = ['ba', 'ko', 'ri', 'tu', 'sa', 'me', 'lo', 'ni', 'pe', 'za', 'chi', 'ran', 'mor', 'del', 'fi']
+SUFFIXES = ['', '', '', 's', 'ing', 'ed', 'ly', 'er']
+
+
+class SyntheticCorpus(object):
+
+    """Random businesses reviewed by a population of users.
+
+    Every user writes about reviews_per_user reviews (Poisson distributed, at least
+    one) on random businesses. Review words are drawn from a vocabulary of invented
+    words with inflected forms, with Zipf distributed frequencies of exponent skew
+    (higher is more skewed).
+    """
+
+    def __init__(self, n_users=1000, reviews_per_user=10, vocabulary=20000, skew=1.2, words_per_review=80,
+                 n_businesses=None, seed=2):
+        self.n_users = n_users
+        self.reviews_per_user = reviews_per_user
+        self.vocabulary = vocabulary
+        self.skew = skew
+        self.words_per_review = words_per_review
+        self.n_businesses = n_businesses or max(n_users // 10, 1)
+        self.seed = seed
+        self._businesses = None
+
+    def words(self):
+
+        """Builds the vocabulary.
+
+        Returns:
+            words (list): vocabulary distinct invented words, the most frequent first.
+        """
+
+        rng = np.random.RandomState(self.seed)
+        words, seen = [], set()
+        while len(words) < self.vocabulary:
+            word = ''.join(rng.choice(SYLLABLES, rng.randint(1, 4))) + rng.choice(SUFFIXES)
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    def _text(self, rng, words):
+        n_words = max(rng.poisson(self.words_per_review), 1)
+        ranks = np.minimum(rng.zipf(self.skew, n_words), self.vocabulary) - 1
+        sentences, start = [], 0
+        while start < n_words:
+            end = start + rng.randint(5, 15)
+            sentence = ' '.join(words[i] for i in ranks[start:end])
+            sentences.append(sentence[0].upper() + sentence[1:] + rng.choice(['.', '.', '!', '?']))
+            start = end
+        return ' '.join(sentences) + ' '
+
+    def businesses(self):
+
+        """Builds the business documents, as the crawler stores them.
+
+        Returns:
+            businesses (list): Business dictionaries with an id, a name and their reviews.
+        """
+
+        if self._businesses is not None:
+            return self._businesses
+        rng = np.random.RandomState(self.seed)
+        words = self.words()
+        first_day = datetime.date(2008, 1, 1)
+        businesses = [{'id': 'business-{0:06d}'.format(i), 'name': 'Business {0}'.format(i), 'reviews': []}
+                      for i in range(self.n_businesses)]
+        for user in range(self.n_users):
+            for _ in range(max(rng.poisson(self.reviews_per_user), 1)):
+                business = businesses[rng.randint(self.n_businesses)]
+                business['reviews'].append({
+                    'user': '/user_details?userid={0:08d}'.format(user),
+                    'review': self._text(rng, words),
+                    'date': (first_day + datetime.timedelta(days=int(rng.randint(3000)))).isoformat(),
+                    'rating': float(rng.randint(1, 6)),
+                })
+        for business in businesses:
+            business['review_count'] = len(business['reviews'])
+        self._businesses = businesses
+        return businesses
+
+    def dataframe(self):
+
+        """Builds the raw review dataframe, as get_raw_dataframe returns it.
+
+        Returns:
+            df (pandas.DataFrame): Reviews with the user, review, date, rating and restaurant columns.
+        """
+
+        rows = [(review['user'], review['review'], review['date'], review['rating'], business['id'])
+                for business in self.businesses() for review in business['reviews']]
+        return pd.DataFrame.from_records(rows, columns=['user', 'review', 'date', 'rating', 'restaurant'])
+
+    def review_pages(self, per_page=20):
+
+        """Renders the review pages of every business in the markup the extractors read.
+
+        Args:
+            per_page (int): Number of reviews per page
+        Returns:
+            pages (list): The html of every review page.
+        """
+
+        pages = []
+        for business in self.businesses():
+            reviews = business['reviews']
+            for start in range(0, max(len(reviews), 1), per_page):
+                pages.append(render_page(reviews[start:start + per_page], len(reviews)))
+        return pages
+
+
+def render_page(reviews, review_count):
+    """Function to render a Yelp-like review page
+
+    Args:
+        reviews (list): The review dictionaries of the page
+        review_count (int): The number of reviews of the business
+    Returns:
+        html (unicode): The review page
+
+    """
+    blocks = []
+    for review in reviews:
+        blocks.append(
+            u'<div class="review review--with-sidebar">'
+            u'<div class="review-sidebar"><a class="user-display-name js-analytics-click" href="{user}">User</a></div>'
+            u'<div class="review-content"><div itemprop="reviewRating">'
+            u'<meta itemprop="ratingValue" content="{rating}"></div>'
+            u'<meta itemprop="datePublished" content="{date}">'
+            u'<p itemprop="description" lang="en">{text}</p></div></div>'.format(
+                user=cgi.escape(review['user'], quote=True), rating=review['rating'], date=review['date'],
+                text=cgi.escape(review['review'])))
+    return (u'<html><head><title>Reviews</title></head><body>'
+            u'<span itemprop="reviewCount">{0}</span>{1}</body></html>').format(review_count, u'\n'.join(blocks))
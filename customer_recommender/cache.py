@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+"""
+On-disk cache of HTTP responses keyed by normalized url.
+"""
+
+import os
+import json
+import time
+import zlib
+import errno
+import hashlib
+import tempfile
+import threading
+import urllib
+import urlparse
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a response is not in the cache."""
+    pass
+
+
+def normalize_url(url):
+
+    """Normalizes a url so that equivalent requests share a cache key.
+
+    The scheme and host are lower cased, the fragment is dropped, the query parameters
+    are sorted and the per-request OAuth parameters (nonce, timestamp, signature) are
+    removed so that two signed requests for the same resource map to the same key.
+
+    Args:
+        url (str): The url to normalize
+    Returns:
+        url (str): The normalized url.
+    """
+
+    parts = urlparse.urlsplit(url)
+    query = [(k, v) for k, v in urlparse.parse_qsl(parts.query, keep_blank_values=True)
+             if not k.startswith('oauth_')]
+    return urlparse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/',
+                                urllib.urlencode(sorted(query)), ''))
+
+
+class ResponseCache(object):
+
+    # default time to live (in seconds) of each resource type
+    TTLS = {
+        'search': 24 * 60 * 60,
+        'business': 7 * 24 * 60 * 60,
+        'page': 24 * 60 * 60,
+    }
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, ttls=None, offline=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = dict(self.TTLS)
+        self.ttls.update(ttls or {})
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def key(self, url):
+
+        """Returns the cache key of a url.
+
+        Args:
+            url (str): The url of the request
+        Returns:
+            key (str): The hex digest of the normalized url.
+        """
+
+        return hashlib.sha1(normalize_url(url)).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, url, resource='page'):
+
+        """Gets a response from the cache.
+
+        Expired entries are ignored, except in offline mode where everything that was
+        ever cached is replayed.
+
+        Args:
+            url (str): The url of the request
+            resource (str): The resource type, used to pick the time to live
+        Returns:
+            text (unicode): The cached body, or None if there is no fresh entry.
+        Raises:
+            CacheMiss: The url is not cached and the cache is offline.
+        """
+
+        path = self.path(self.key(url))
+        try:
+            with open(path, 'rb') as infile:
+                header, body = zlib.decompress(infile.read()).split('\n', 1)
+        except (IOError, OSError, zlib.error, ValueError):
+            return self._miss(url)
+
+        stored = json.loads(header)['stored']
+        if not self.offline and time.time() - stored > self.ttls.get(resource, self.TTLS['page']):
+            return self._miss(url)
+
+        # touch the entry, the modification time orders the least recently used eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return body.decode('utf-8')
+
+    def _miss(self, url):
+        self.misses += 1
+        if self.offline:
+            raise CacheMiss(url)
+        return None
+
+    def put(self, url, text, resource='page'):
+
+        """Stores a response in the cache and evicts the least recently used entries above max_bytes.
+
+        Args:
+            url (str): The url of the request
+            text (unicode): The body of the response
+            resource (str): The resource type of the response
+        Returns:
+            None
+        """
+
+        key = self.key(url)
+        header = json.dumps({'url': normalize_url(url), 'resource': resource, 'stored': time.time()})
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        data = zlib.compress(header + '\n' + text)
+
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # write to a temporary file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(data)
+
+        with self._lock:
+            size = self.size()
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.rename(tmp, path)
+            self._size = size + len(data) - previous
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+
+        """Lists the entries of the cache.
+
+        Returns:
+            entries (list): A list of (modification time, size, path) tuples.
+        """
+
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def items(self, resource=None):
+
+        """Iterates over the cached responses, regardless of their age.
+
+        Args:
+            resource (str): An optional resource type to restrict the responses to
+        Returns:
+            items (generator): (url, text) tuples of the cached responses.
+        """
+
+        for mtime, size, path in self.entries():
+            try:
+                with open(path, 'rb') as infile:
+                    header, body = zlib.decompress(infile.read()).split('\n', 1)
+            except (IOError, OSError, zlib.error, ValueError):
+                continue
+            header = json.loads(header)
+            if resource is None or header['resource'] == resource:
+                yield header['url'], body.decode('utf-8')
+
+    def size(self):
+
+        """Gets the total size (in bytes) of the cache.
+
+        Returns:
+            size (int): The size of all the entries.
+        """
+
+        if self._size is None:
+            self._size = sum(size for mtime, size, path in self.entries())
+        return self._size
+
+    def evict(self):
+
+        """Removes the least recently used entries until the cache fits in max_bytes.
+
+        Eviction goes down to 90% of max_bytes so that the directory is not walked again
+        on every subsequent write.
+
+        Returns:
+            evicted (int): The number of entries removed.
+        """
+
+        evicted = 0
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+        self._size = size
+        return evicted
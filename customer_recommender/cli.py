@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Command line interface of the customer recommender, installed as customer-recommender:
+
+    $ customer-recommender crawl --location "Flatiron, New York, NY"
+    $ customer-recommender cluster
+    $ customer-recommender sweep 4 8 12
+    $ customer-recommender pipeline --serve
+    $ customer-recommender serve --port 8000
+    $ customer-recommender serve --production --workers 4 --threads 8
+    $ customer-recommender --set num_clusters=12 --set features=hashing cluster
+    $ customer-recommender benchmark suite --users 2000
+
+Commands never prompt, they read their flags and the configuration files, --config and
+--set override the settings for a single run. Only the modules of the command that runs
+are imported, so pandas, sklearn and nltk are not loaded and MongoDB is not connected to
+before a command needs them.
+"""
+
+import sys
+import argparse
+
+BENCHMARKS = ('suite', 'features', 'aggregate', 'extract', 'imports', 'api')
+
+
+def parse_setting(value):
+    """Function to parse a KEY=VALUE setting override, the value is read as YAML"""
+
+    import yaml
+    key, sep, raw = value.partition('=')
+    if not sep or not key.strip():
+        raise argparse.ArgumentTypeError("expected KEY=VALUE, got '{0}'".format(value))
+    return key.strip().lower(), yaml.safe_load(raw)
+
+
+def configure(paths=(), overrides=()):
+
+    """Applies configuration files and setting overrides on top of the loaded settings.
+
+    Args:
+        paths (list): Paths of YAML configuration files, applied in order
+        overrides (list): (key, value) settings applied last
+    Returns:
+        None
+    """
+
+    import yaml
+    from customer_recommender.config import settings
+    for path in paths:
+        with open(path, 'r') as conf:
+            settings.configure(yaml.safe_load(conf))
+    settings.configure(dict(overrides))
+
+
+def config_args(paths=(), overrides=()):
+    """Function to build the --config and --set arguments that apply the same settings in another process"""
+
+    import json
+    args = []
+    for path in paths:
+        args += ['--config', path]
+    for key, value in overrides:
+        # JSON is valid YAML, parse_setting reads the value back unchanged
+        args += ['--set', '{0}={1}'.format(key, json.dumps(value, default=str))]
+    return args
+
+
+def crawl(args):
+    from customer_recommender.ingest.yelp import Yelp
+    try:
+        yelp = Yelp(location=args.location, term=args.term, radius=args.radius, interactive=False)
+    except ValueError as e:
+        sys.exit('customer-recommender crawl: {0}'.format(e))
+    yelp.main()
+
+
+def cluster(args):
+    from customer_recommender.wrangle import cluster_data
+    cluster_data.main()
+
+
+def sweep(args):
+    from customer_recommender.wrangle import clustering
+    clustering.main(args.ks or range(4, 21, 2))
+
+
+def pipeline(args):
+    from customer_recommender.pipeline import STAGES, Pipeline
+    unknown = set(args.stages + args.force) - set(STAGES)
+    if unknown:
+        sys.exit('customer-recommender pipeline: unknown stages: {0}'.format(', '.join(sorted(unknown))))
+    pipeline = Pipeline(location=args.location, interactive=False,
+                        config_args=config_args(args.config, args.overrides))
+    pipeline.run(args.stages or STAGES, force=args.force, serve=args.serve)
+
+
+def serve(args):
+    from customer_recommender.config import settings
+    if args.production or settings.get('serve_mode', 'development') == 'production':
+        from customer_recommender.visualize import server
+        server.main(host=args.host, port=args.port, workers=args.workers, threads=args.threads)
+    else:
+        from customer_recommender.visualize import app
+        app.main(host=args.host, port=args.port, debug=args.debug)
+
+
+def benchmark(args):
+    import runpy
+    module = 'customer_recommender.benchmark.{0}'.format(args.name)
+    # the benchmark parses its own arguments, as when it runs with python -m
+    sys.argv = [module] + args.args
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+def get_parser():
+    """Function to build the argument parser of every command"""
+
+    parser = argparse.ArgumentParser(prog='customer-recommender',
+                                     description='Recommends the best customers of a restaurant from Yelp reviews')
+    parser.add_argument('--config', action='append', default=[], metavar='PATH',
+                        help='YAML configuration applied on top of conf/config.yaml, can be repeated')
+    parser.add_argument('--set', action='append', default=[], type=parse_setting, dest='overrides',
+                        metavar='KEY=VALUE', help='override a setting, the value is read as YAML, can be repeated')
+    commands = parser.add_subparsers(title='commands', dest='command')
+
+    command = commands.add_parser('crawl', help='crawl Yelp reviews into MongoDB')
+    command.add_argument('--location', help='location to crawl instead of crawl_bounds and crawl_locations')
+    command.add_argument('--term', default='restaurants', help='search term (default: restaurants)')
+    command.add_argument('--radius', type=int, default=1000, help='search radius in meters (default: 1000)')
+    command.set_defaults(run=crawl)
+
+    command = commands.add_parser('cluster', help='cluster the users and write data.csv')
+    command.set_defaults(run=cluster)
+
+    command = commands.add_parser('sweep', help='compare the inertia and silhouette of numbers of clusters')
+    command.add_argument('ks', nargs='*', type=int, help='numbers of clusters (default: 4 to 20 by 2)')
+    command.set_defaults(run=sweep)
+
+    command = commands.add_parser('pipeline', help='run the stages that are not up to date')
+    command.add_argument('stages', nargs='*', help='stages to run: ingest, cluster (default: all)')
+    command.add_argument('--force', action='append', default=[], metavar='STAGE',
+                         help='run a stage even if up to date')
+    command.add_argument('--serve', action='store_true', help='launch the web app at the end')
+    command.add_argument('--location', help='location to crawl instead of crawl_bounds and crawl_locations')
+    command.set_defaults(run=pipeline)
+
+    command = commands.add_parser('serve', help='launch the web app')
+    command.add_argument('--host', default='0.0.0.0')
+    command.add_argument('--port', type=int, default=5000)
+    command.add_argument('--debug', action='store_true', help='development server only')
+    command.add_argument('--production', action='store_true',
+                         help='serve with gunicorn workers, as serve_mode: production does')
+    command.add_argument('--workers', type=int, help='worker processes in production (default: serve_workers)')
+    command.add_argument('--threads', type=int, help='threads per worker in production (default: serve_threads)')
+    command.set_defaults(run=serve)
+
+    command = commands.add_parser('benchmark', help='run a benchmark, the arguments are passed on to it')
+    command.add_argument('name', choices=BENCHMARKS)
+    command.add_argument('args', nargs=argparse.REMAINDER)
+    command.set_defaults(run=benchmark)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    configure(args.config, args.overrides)
+    args.run(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
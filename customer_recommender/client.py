@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""
+Shared HTTP client used by every network call of the crawler.
+"""
+
+import json
+import time
+import urlparse
+import threading
+import requests
+from collections import deque
+from requests.adapters import HTTPAdapter
+from customer_recommender.cache import ResponseCache
+from customer_recommender.config import settings
+from customer_recommender.ratelimit import AdaptiveRateLimiter, Backoff
+
+
+class HTTPClient(object):
+
+    DEFAULT_HEADERS = {
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+        'User-Agent': 'CustomerRecommender/0.1',
+    }
+
+    # statuses retried after a backoff
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # latencies kept per host for the percentiles
+    LATENCY_SAMPLES = 2048
+
+    def __init__(self, timeout=30, pool_connections=10, pool_maxsize=10, cache=None, limiters=None, backoff=None):
+        self.timeout = timeout
+        self.cache = cache
+        # one rate limiter per endpoint class, keyed like the cache resource types
+        self.limiters = limiters or {}
+        self.backoff = backoff or Backoff(max_retries=0)
+        self.session = requests.Session()
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        # keep-alive pools of pool_maxsize connections for up to pool_connections hosts
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._latencies = {}
+        self._latency_lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None, resource=None, sign=None):
+
+        """Sends a GET request over a pooled connection.
+
+        The request waits for the rate limiter of its resource type and is retried with
+        a jittered exponential backoff on connection errors, 429 and 5xx responses.
+
+        Args:
+            url (str): The url to request
+            params (dict): An optional set of query parameters in request.
+            timeout (float): An optional timeout (in seconds), defaults to the client timeout
+            resource (str): The resource type, used to pick the rate limiter
+            sign (function): An optional function returning a freshly signed url for every attempt
+        Returns:
+            response (requests.Response): The response of the request.
+        Raises:
+            requests.RequestException: The connection failed on every attempt.
+        """
+
+        limiter = self.limiters.get(resource)
+        host = urlparse.urlparse(url).netloc
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            start_time = time.time()
+            try:
+                response = self.session.get(sign() if sign else url, params=params, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(limiter, host, False, time.time() - start_time)
+                if attempt >= self.backoff.max_retries:
+                    raise
+                retry_after = None
+            else:
+                ok = response.status_code not in self.RETRY_STATUSES
+                self._record(limiter, host, ok, time.time() - start_time)
+                if ok or attempt >= self.backoff.max_retries:
+                    return response
+                retry_after = self._retry_after(response)
+            if limiter is not None:
+                limiter.record_retry()
+            time.sleep(self.backoff.delay(attempt, retry_after))
+            attempt += 1
+
+    def _record(self, limiter, host, ok, latency):
+        if limiter is not None:
+            limiter.record(ok, latency)
+        with self._latency_lock:
+            counters = self._latencies.get(host)
+            if counters is None:
+                counters = self._latencies[host] = {'requests': 0, 'errors': 0, 'seconds': 0.0,
+                                                    'samples': deque(maxlen=self.LATENCY_SAMPLES)}
+            counters['requests'] += 1
+            counters['errors'] += 0 if ok else 1
+            counters['seconds'] += latency
+            counters['samples'].append(latency)
+
+    def _retry_after(self, response):
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+    def get_json(self, url, params=None, resource='business', sign=None):
+
+        """Sends a GET request and decodes the JSON body of the response.
+
+        Args:
+            url (str): The url to request
+            params (dict): An optional set of query parameters in request.
+            resource (str): The resource type, used to pick the cache time to live
+            sign (function): An optional function returning a freshly signed url for every attempt
+        Returns:
+            dict: The JSON response from the request.
+        Raises:
+            requests.HTTPError: An error occurs from the HTTP request.
+            cache.CacheMiss: The response is not cached and the cache is offline.
+        """
+
+        key = self.cache_url(url, params)
+        text = self._from_cache(key, resource)
+        if text is None:
+            response = self.get(url, params=params, resource=resource, sign=sign)
+            response.raise_for_status()
+            text = response.text
+            self._to_cache(key, response, text, resource)
+        return json.loads(text)
+
+    def get_text(self, url, params=None, resource='page'):
+
+        """Sends a GET request and returns the decoded body of the response.
+
+        Args:
+            url (str): The url to request
+            params (dict): An optional set of query parameters in request.
+            resource (str): The resource type, used to pick the cache time to live
+        Returns:
+            text (unicode): The body of the response.
+        Raises:
+            requests.HTTPError: An error occurs from the HTTP request, also once the retries of a throttled
+                or failing page are exhausted.
+            cache.CacheMiss: The response is not cached and the cache is offline.
+        """
+
+        key = self.cache_url(url, params)
+        text = self._from_cache(key, resource)
+        if text is None:
+            response = self.get(url, params=params, resource=resource)
+            # an error body would be parsed as a page without reviews
+            response.raise_for_status()
+            text = response.text
+            self._to_cache(key, response, text, resource)
+        return text
+
+    def cache_url(self, url, params=None):
+        # responses are cached under the requested url, not the url redirected to
+        if self.cache is None or not params:
+            return url
+        return requests.Request('GET', url, params=params).prepare().url
+
+    def _from_cache(self, url, resource):
+        if self.cache is None:
+            return None
+        return self.cache.get(url, resource)
+
+    def _to_cache(self, url, response, text, resource):
+        # only successful responses are replayed, error bodies are never stored
+        if self.cache is not None and response.status_code == 200:
+            self.cache.put(url, text, resource)
+
+    def stats(self):
+
+        """Reports the connection reuse counters of every host contacted.
+
+        Returns:
+            stats (dict): For each host, the number of requests sent, the number of connections
+            opened and the number of requests that reused an open connection.
+        """
+
+        stats = {}
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = stats.setdefault(pool.host, {'requests': 0, 'connections': 0, 'reused': 0})
+                host['requests'] += pool.num_requests
+                host['connections'] += pool.num_connections
+                host['reused'] += max(pool.num_requests - pool.num_connections, 0)
+        return stats
+
+    def rate_stats(self):
+
+        """Reports the live rate and retry counters of every endpoint class.
+
+        Returns:
+            stats (dict): For each resource type, the allowed rate, the observed requests per
+            second and the number of requests, errors and retries.
+        """
+
+        return dict((resource, limiter.stats()) for resource, limiter in self.limiters.items())
+
+    def latency_stats(self):
+
+        """Reports the request latencies of every host contacted.
+
+        Returns:
+            stats (dict): For each host, the number of requests and errors, the mean latency and
+            the 50th, 95th and 99th percentiles and maximum of the most recent latencies (in seconds).
+        """
+
+        stats = {}
+        with self._latency_lock:
+            for host, counters in self._latencies.items():
+                samples = sorted(counters['samples'])
+                percentile = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)]
+                stats[host] = {
+                    'requests': counters['requests'],
+                    'errors': counters['errors'],
+                    'mean': counters['seconds'] / counters['requests'],
+                    'p50': percentile(0.5),
+                    'p95': percentile(0.95),
+                    'p99': percentile(0.99),
+                    'max': samples[-1],
+                }
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+# default maximum requests per second of each endpoint class
+RATE_LIMITS = {
+    'search': 5,
+    'business': 5,
+    'page': 10,
+}
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client():
+
+    """Returns the process wide HTTPClient, creating it from the settings on first use.
+
+    Returns:
+        client (HTTPClient): The shared client.
+    """
+
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            cache = None
+            if settings.get('cache_dir', 'output/cache'):
+                cache = ResponseCache(settings.get('cache_dir', 'output/cache'),
+                                      max_bytes=int(settings.get('cache_max_mb', 1024)) * 1024 * 1024,
+                                      ttls=settings.get('cache_ttl'),
+                                      offline=bool(settings.get('offline', False)))
+            rate_limits = dict(RATE_LIMITS)
+            rate_limits.update(settings.get('rate_limits') or {})
+            limiters = dict((resource, AdaptiveRateLimiter(float(rate),
+                                                           target_latency=float(settings.get('target_latency', 2.0))))
+                            for resource, rate in rate_limits.items())
+            _CLIENT = HTTPClient(timeout=float(settings.get('http_timeout', 30)),
+                                 pool_maxsize=int(settings.get('http_pool_size', 10)),
+                                 cache=cache,
+                                 limiters=limiters,
+                                 backoff=Backoff(max_retries=int(settings.get('max_retries', 5))))
+        return _CLIENT
@@ -1,7 +1,19 @@
 #!/usr/bin/env python
 import os
-import requests
+import threading
+import urlparse
+from multiprocessing.pool import ThreadPool
 from bs4 import BeautifulSoup
+from .client import get_client
+from .config import settings
+
+# per-host semaphores shared by every concurrent fetch in the process
+_HOST_LIMITS = {}
+_HOST_LIMITS_LOCK = threading.Lock()
+
+# the MongoDB database, connected on first use
+_DATABASE = None
+_DATABASE_LOCK = threading.Lock()
 
 def create_dir(directory):
 
@@ -17,6 +29,25 @@ def create_dir(directory):
         os.makedirs(directory)
 
 
+def get_database():
+
+    """Returns the MongoDB database of the settings, connecting on first use.
+
+    Importing a module does not connect, only the commands that read or write the
+    database do.
+
+    Returns:
+        database (pymongo.database.Database): The shared database handle.
+    """
+
+    global _DATABASE
+    with _DATABASE_LOCK:
+        if _DATABASE is None:
+            from pymongo import MongoClient
+            _DATABASE = MongoClient(settings.get('mongo_uri'))[settings.get('database', 'yelpdb')]
+        return _DATABASE
+
+
 def get_soup_from_url(url):
 
     """Takes url and returns bs4.BeautifulSoup class.
@@ -28,6 +59,68 @@ def get_soup_from_url(url):
 
     """    
 
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
+    soup = BeautifulSoup(get_html_from_url(url), 'lxml')
     return soup
 
+
+def get_html_from_url(url):
+
+    """Takes url and returns the html of the page.
+
+    Args:
+        url (str): A string for the url
+    Returns:
+        html (unicode): The decoded body of the page.
+
+    """
+
+    return get_client().get_text(url, resource='page')
+
+
+def get_host_limit(host, per_host=4):
+
+    """Returns the semaphore capping the number of concurrent requests to a host.
+
+    Args:
+        host (str): The network location of a url
+        per_host (int): Maximum number of requests in flight against the host
+    Returns:
+        semaphore (threading.BoundedSemaphore): The semaphore shared by all fetches to host.
+
+    """
+
+    with _HOST_LIMITS_LOCK:
+        if host not in _HOST_LIMITS:
+            _HOST_LIMITS[host] = threading.BoundedSemaphore(max(per_host, 1))
+        return _HOST_LIMITS[host]
+
+
+def get_html_from_urls(urls, workers=4, per_host=4):
+
+    """Fetches a list of urls concurrently and returns the html of each page.
+
+    Args:
+        urls (list): A list of url strings
+        workers (int): Number of threads used to fetch the urls
+        per_host (int): Maximum number of requests in flight against a single host
+    Returns:
+        pages (list): The html of the pages, in the same order as urls.
+
+    """
+
+    urls = list(urls)
+    if workers <= 1 or len(urls) <= 1:
+        return [get_html_from_url(url) for url in urls]
+
+    def fetch(url):
+        with get_host_limit(urlparse.urlparse(url).netloc, per_host):
+            return get_html_from_url(url)
+
+    pool = ThreadPool(min(workers, len(urls)))
+    try:
+        # map preserves the order of the input urls
+        pages = pool.map(fetch, urls)
+    finally:
+        pool.close()
+        pool.join()
+    return pages
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""
+Review extractors that turn a Yelp review page into review dictionaries.
+"""
+
+import threading
+from bs4 import BeautifulSoup
+from lxml import etree
+
+
+class SoupExtractor(object):
+
+    """Parses the whole page into a BeautifulSoup tree and searches it."""
+
+    name = 'bs4'
+
+    def get_number_reviews(self, html):
+
+        """Gets the unique number of reviews from the first review page of a business.
+
+        Args:
+            html (unicode): The review page
+        Returns:
+            number_reviews (int): The unique number of reviews for a business.
+        """
+
+        soup = BeautifulSoup(html, 'lxml')
+        return int(soup.find(itemprop='reviewCount').text)
+
+    def get_reviews(self, html):
+
+        """Gets the reviews from a single review page.
+
+        Args:
+            html (unicode): The review page
+        Returns:
+            reviews (list): A list of dictionaries. Each dictionary contains a single review by
+            user containing the date, the review, and the rating.
+        """
+
+        soup = BeautifulSoup(html, 'lxml')
+        reviews = []
+        for review in soup.find_all(class_='review--with-sidebar'):
+            review_dict = {}
+            # get user info
+            try:
+                user = review.find(class_='user-display-name').attrs.get('href')
+                review_dict['user'] = user
+            except:
+                pass
+            # get review
+            try:
+                rev = review.find(itemprop='description').text
+                review_dict['review'] = rev
+            except:
+                pass
+            # get review date
+            try:
+                date = review.find(itemprop='datePublished').attrs.get('content')
+                review_dict['date'] = date
+                # review_dict['date'] = datetime.strptime(date,'%Y-%m-%d')
+            except:
+                pass
+            # get review rating
+            try:
+                rating = review.find(itemprop='ratingValue').attrs.get('content')
+                review_dict['rating'] = float(rating)
+            except:
+                pass
+            # only append if review dict is not empty
+            if len(review_dict) != 0:
+                reviews.append(review_dict)
+        return reviews
+
+
+def _has_class(name):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' {0} ')".format(name)
+
+
+class LxmlExtractor(object):
+
+    """Parses the page with lxml and runs precompiled XPath selectors on it.
+
+    The selectors reproduce the BeautifulSoup searches of SoupExtractor: the first
+    descendant matching a class or an itemprop, in document order.
+    """
+
+    name = 'lxml'
+
+    REVIEW_COUNT = etree.XPath("string(//*[@itemprop='reviewCount'][1])")
+    REVIEWS = etree.XPath("//*[{0}]".format(_has_class('review--with-sidebar')))
+    USER = etree.XPath("descendant::*[{0}][1]".format(_has_class('user-display-name')))
+    DESCRIPTION = etree.XPath("string(descendant::*[@itemprop='description'][1])")
+    HAS_DESCRIPTION = etree.XPath("boolean(descendant::*[@itemprop='description'])")
+    DATE = etree.XPath("descendant::*[@itemprop='datePublished'][1]")
+    RATING = etree.XPath("descendant::*[@itemprop='ratingValue'][1]")
+
+    def __init__(self):
+        # lxml parsers must not be shared between threads
+        self._local = threading.local()
+
+    def parse(self, html):
+
+        """Parses a page into an lxml tree.
+
+        Args:
+            html (unicode): The review page
+        Returns:
+            tree (lxml.etree._Element): The root of the page.
+        """
+
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = etree.HTMLParser(encoding='utf-8')
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
+        return etree.fromstring(html, parser)
+
+    def get_number_reviews(self, html):
+
+        """Gets the unique number of reviews from the first review page of a business.
+
+        Args:
+            html (unicode): The review page
+        Returns:
+            number_reviews (int): The unique number of reviews for a business.
+        """
+
+        return int(self.REVIEW_COUNT(self.parse(html)))
+
+    def get_reviews(self, html):
+
+        """Gets the reviews from a single review page.
+
+        Args:
+            html (unicode): The review page
+        Returns:
+            reviews (list): A list of dictionaries. Each dictionary contains a single review by
+            user containing the date, the review, and the rating.
+        """
+
+        tree = self.parse(html)
+        if tree is None:
+            return []
+
+        reviews = []
+        for review in self.REVIEWS(tree):
+            review_dict = {}
+            # get user info
+            user = self.USER(review)
+            if user:
+                review_dict['user'] = user[0].get('href')
+            # get review
+            if self.HAS_DESCRIPTION(review):
+                review_dict['review'] = unicode(self.DESCRIPTION(review))
+            # get review date
+            date = self.DATE(review)
+            if date:
+                review_dict['date'] = date[0].get('content')
+            # get review rating
+            rating = self.RATING(review)
+            if rating:
+                try:
+                    review_dict['rating'] = float(rating[0].get('content'))
+                except (TypeError, ValueError):
+                    pass
+            # only append if review dict is not empty
+            if len(review_dict) != 0:
+                reviews.append(review_dict)
+        return reviews
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+}
+
+
+def get_extractor(name='lxml'):
+
+    """Returns a review extractor by name.
+
+    Args:
+        name (str): The name of the extractor backend, 'lxml' or 'bs4'
+    Returns:
+        extractor: An instance of the extractor.
+    Raises:
+        ValueError: No extractor is registered under name.
+    """
+
+    try:
+        return EXTRACTORS[name]()
+    except KeyError:
+        raise ValueError("Unknown review extractor '{0}', choose from: {1}".format(
+            name, ', '.join(sorted(EXTRACTORS))))
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+"""
+Splits a metro area into tiles and crawls them over a pool of workers,
+recording progress in a checkpoint journal so that a crash can resume.
+"""
+
+import os
+import json
+import math
+import Queue
+import threading
+import traceback
+from collections import namedtuple
+from ..helper import create_dir
+
+# meters in a degree of latitude
+METERS_PER_DEGREE = 111320.0
+
+
+class Tile(namedtuple('Tile', ['sw_lat', 'sw_lon', 'ne_lat', 'ne_lon', 'location'])):
+
+    """A bounding box, or a named location searched with the crawler's radius."""
+
+    @classmethod
+    def from_location(klass, location):
+        return klass(None, None, None, None, location)
+
+    @property
+    def key(self):
+        if self.location is not None:
+            return u'location:{0}'.format(self.location)
+        return u'bounds:{0:.6f},{1:.6f}|{2:.6f},{3:.6f}'.format(*self[:4])
+
+    @property
+    def bounds(self):
+        if self.location is not None:
+            return None
+        return '{0:.6f},{1:.6f}|{2:.6f},{3:.6f}'.format(*self[:4])
+
+    def split(self):
+
+        """Splits a bounding box tile into four quadrants.
+
+        Returns:
+            tiles (list): The four quadrant tiles, or an empty list for a named location.
+        """
+
+        if self.location is not None:
+            return []
+        mid_lat = (self.sw_lat + self.ne_lat) / 2.0
+        mid_lon = (self.sw_lon + self.ne_lon) / 2.0
+        return [
+            Tile(self.sw_lat, self.sw_lon, mid_lat, mid_lon, None),
+            Tile(self.sw_lat, mid_lon, mid_lat, self.ne_lon, None),
+            Tile(mid_lat, self.sw_lon, self.ne_lat, mid_lon, None),
+            Tile(mid_lat, mid_lon, self.ne_lat, self.ne_lon, None),
+        ]
+
+
+def split_bbox(bbox, tile_size=1000):
+
+    """Splits a bounding box into a grid of tiles.
+
+    Args:
+        bbox (list): The [sw_lat, sw_lon, ne_lat, ne_lon] corners of the area
+        tile_size (float): The side of a tile (in meters)
+    Returns:
+        tiles (list): The grid of tiles covering the bounding box.
+    """
+
+    sw_lat, sw_lon, ne_lat, ne_lon = [float(x) for x in bbox]
+    lat_step = tile_size / METERS_PER_DEGREE
+    lon_step = tile_size / (METERS_PER_DEGREE * max(math.cos(math.radians((sw_lat + ne_lat) / 2.0)), 1e-6))
+    n_lat = max(int(math.ceil((ne_lat - sw_lat) / lat_step)), 1)
+    n_lon = max(int(math.ceil((ne_lon - sw_lon) / lon_step)), 1)
+
+    tiles = []
+    for i in range(n_lat):
+        for j in range(n_lon):
+            tiles.append(Tile(sw_lat + i * lat_step, sw_lon + j * lon_step,
+                              min(sw_lat + (i + 1) * lat_step, ne_lat),
+                              min(sw_lon + (j + 1) * lon_step, ne_lon), None))
+    return tiles
+
+
+class StopCrawl(Exception):
+
+    """Raised by a handler to stop the crawl, the tiles left are crawled on the next run."""
+
+
+class Acknowledgement(object):
+
+    """Calls back once every write it waits for is done, writes are counted with add()."""
+
+    def __init__(self, callback, count=0):
+        self.callback = callback
+        self.count = count
+        self._lock = threading.Lock()
+
+    def add(self, count=1):
+        with self._lock:
+            self.count += count
+
+    def __call__(self):
+        with self._lock:
+            self.count -= 1
+            done = self.count == 0
+        if done:
+            self.callback()
+
+
+class CheckpointJournal(object):
+
+    """Append-only JSON lines journal of the tiles split or finished and the businesses crawled."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            create_dir(os.path.dirname(path))
+
+    def load(self):
+
+        """Reads the progress recorded by a previous run.
+
+        Returns:
+            done (set): Keys of the finished tiles.
+            splits (dict): The child tiles of every split tile, keyed by the tile key.
+            businesses (set): Ids of the businesses already crawled.
+        """
+
+        done, splits, businesses = set(), {}, set()
+        if not os.path.exists(self.path):
+            return done, splits, businesses
+        with open(self.path, 'r') as infile:
+            for line in infile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line may be truncated by a crash
+                    continue
+                if 'done' in entry:
+                    done.add(entry['done'])
+                elif 'split' in entry:
+                    splits[entry['split']] = [Tile(*child) for child in entry['children']]
+                elif 'business' in entry:
+                    businesses.add(entry['business'])
+        return done, splits, businesses
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def record(self, entry):
+        with self._lock:
+            with open(self.path, 'a') as outfile:
+                outfile.write(json.dumps(entry) + '\n')
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CrawlScheduler(object):
+
+    """Crawls a list of tiles over a pool of worker threads.
+
+    Tiles whose search hits the API's result cap are split into quadrants. Business
+    ids are deduplicated across tiles. A business is journaled once its documents are
+    written, and a tile once all of its businesses are, so a rerun after a crash only
+    crawls what is left and never skips a business whose writes were lost.
+    """
+
+    # the search API stops returning results past this offset
+    MAX_RESULTS = 1000
+    # tiles are not split below this size (in degrees of latitude, about 50m)
+    MIN_TILE = 50 / METERS_PER_DEGREE
+
+    def __init__(self, yelp, tiles, journal, workers=4):
+        self.yelp = yelp
+        self.tiles = tiles
+        self.journal = journal
+        self.workers = workers
+        self.errors = []
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._claimed = set()
+        self._stopped = threading.Event()
+
+    def pending(self):
+
+        """Gets the tiles left to crawl, expanding the tiles split by a previous run.
+
+        Returns:
+            tiles (list): The tiles that are not finished yet.
+        """
+
+        done, splits, businesses = self.journal.load()
+        self._claimed = businesses
+        pending = []
+        stack = list(reversed(self.tiles))
+        while stack:
+            tile = stack.pop()
+            if tile.key in done:
+                continue
+            if tile.key in splits:
+                stack.extend(reversed(splits[tile.key]))
+            else:
+                pending.append(tile)
+        return pending
+
+    def claim(self, business_id):
+        with self._lock:
+            if business_id in self._claimed:
+                return False
+            self._claimed.add(business_id)
+            return True
+
+    def crawl_tile(self, tile, handle):
+
+        """Crawls the businesses of a tile, or splits it when it has too many results.
+
+        Args:
+            tile (Tile): The tile to crawl
+            handle (function): Called with every business id found for the first time and a callback
+                to call once the documents of the business are written
+        Returns:
+            None
+        """
+
+        yelp = self.yelp
+        if tile.bounds is not None and tile.ne_lat - tile.sw_lat > self.MIN_TILE:
+            total = yelp.get_search_total(yelp.term, bounds=tile.bounds)
+            if total >= self.MAX_RESULTS:
+                children = tile.split()
+                self.journal.record({'split': tile.key, 'children': [list(child) for child in children]})
+                for child in children:
+                    self._queue.put(child)
+                return
+
+        # the tile is done when the search is over and every business of it is written
+        tile_done = Acknowledgement(lambda: self.journal.record({'done': tile.key}), 1)
+        for business_id in yelp.get_business_ids(yelp.term, tile.location, yelp.radius, bounds=tile.bounds):
+            if self.claim(business_id):
+                tile_done.add()
+                handle(business_id, self.written(business_id, tile_done))
+        tile_done()
+
+    def written(self, business_id, tile_done):
+        def callback():
+            self.journal.record({'business': business_id})
+            tile_done()
+        return callback
+
+    def _work(self, handle):
+        while True:
+            tile = self._queue.get()
+            if tile is None:
+                self._queue.task_done()
+                return
+            if self._stopped.is_set():
+                # the tile is left pending in the journal
+                self._queue.task_done()
+                continue
+            try:
+                self.crawl_tile(tile, handle)
+            except StopCrawl:
+                self.errors.append((tile, traceback.format_exc()))
+                if not self._stopped.is_set():
+                    self._stopped.set()
+                    print ("Crawl stopped: {0}").format(traceback.format_exc().strip().splitlines()[-1])
+            except Exception:
+                # the tile is not journaled as done, the next run retries it
+                self.errors.append((tile, traceback.format_exc()))
+                print ("Crawling {0} failed, it will be retried on the next run").format(tile.key)
+            finally:
+                self._queue.task_done()
+
+    def run(self, handle):
+
+        """Crawls every pending tile.
+
+        The journal is kept, the caller clears it once the queued writes are done.
+
+        Args:
+            handle (function): Called with every business id found for the first time and a callback
+                to call once the documents of the business are written
+        Returns:
+            errors (list): (tile, traceback) of the tiles that failed.
+        """
+
+        for tile in self.pending():
+            self._queue.put(tile)
+
+        threads = [threading.Thread(target=self._work, args=(handle,)) for _ in range(max(self.workers, 1))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        # split tiles are queued while the workers run
+        self._queue.join()
+        for thread in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        return self.errors
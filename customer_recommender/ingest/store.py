@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""
+Local SQLite store of the crawled businesses and their reviews.
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import sqlite3
+import threading
+from ..helper import create_dir
+
+# VACUUM INTO copies a database in one statement since SQLite 3.27
+VACUUM_INTO = sqlite3.sqlite_version_info >= (3, 27, 0)
+
+
+class LocalStore(object):
+
+    """A single file store of crawled businesses.
+
+    The business JSON is kept zlib-compressed, the reviews go in their own table so
+    that the wrangle step can read them all with a single query. Every write happens
+    in one transaction, so a crash never leaves a half written business behind.
+    """
+
+    REVIEW_FIELDS = ('user', 'review', 'date', 'rating')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS businesses (
+            id TEXT PRIMARY KEY,
+            info BLOB NOT NULL,
+            last_review_date TEXT,
+            updated REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS reviews (
+            business_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            user TEXT,
+            review TEXT,
+            date TEXT,
+            rating REAL,
+            PRIMARY KEY (business_id, position)
+        );
+    """
+
+    def __init__(self, path=os.path.join('output', 'crawl.db')):
+        self.path = path
+        if os.path.dirname(path):
+            create_dir(os.path.dirname(path))
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_business(self, business_id):
+
+        """Gets a stored business.
+
+        Args:
+            business_id (str): A unique business id for each Yelp business
+        Returns:
+            d (dict): The business dictionary with its reviews, or None if it is not stored.
+        """
+
+        with self._lock:
+            row = self.connection.execute('SELECT info FROM businesses WHERE id = ?', (business_id,)).fetchone()
+            if row is None:
+                return None
+            rows = self.connection.execute(
+                'SELECT user, review, date, rating FROM reviews WHERE business_id = ? ORDER BY position',
+                (business_id,)).fetchall()
+        d = json.loads(zlib.decompress(row[0]))
+        d['reviews'] = [self._review_dict(r) for r in rows]
+        return d
+
+    def _review_dict(self, row):
+        # missing fields were never set on the scraped review
+        return dict((k, v) for k, v in zip(self.REVIEW_FIELDS, row) if v is not None)
+
+    def put_business(self, d):
+
+        """Stores a business, replacing any previous version of it.
+
+        Args:
+            d (dict): A business dictionary with an 'id' and its 'reviews'
+        Returns:
+            None
+        """
+
+        info = dict((k, v) for k, v in d.items() if k not in ('reviews', '_id'))
+        with self._lock, self.connection:
+            self.connection.execute('DELETE FROM reviews WHERE business_id = ?', (d['id'],))
+            self._write(info, d.get('reviews', []), 0)
+
+    def merge_reviews(self, business_id, info, reviews):
+
+        """Updates a business and appends the reviews that are not stored yet.
+
+        Args:
+            business_id (str): A unique business id for each Yelp business
+            info (dict): The business fields to update
+            reviews (list): Review dictionaries, the ones already stored are skipped
+        Returns:
+            None
+        Raises:
+            KeyError: The business is not stored, merging would leave a partial business.
+        """
+
+        with self._lock, self.connection:
+            row = self.connection.execute('SELECT info FROM businesses WHERE id = ?', (business_id,)).fetchone()
+            if row is None:
+                raise KeyError(business_id)
+            stored = json.loads(zlib.decompress(row[0]))
+            stored.update(dict((k, v) for k, v in info.items() if k not in ('reviews', '_id')))
+            stored['id'] = business_id
+
+            existing = set(tuple(r) for r in self.connection.execute(
+                'SELECT user, review, date, rating FROM reviews WHERE business_id = ?', (business_id,)))
+            position = self.connection.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM reviews WHERE business_id = ?',
+                (business_id,)).fetchone()[0]
+            new = [r for r in reviews if tuple(r.get(k) for k in self.REVIEW_FIELDS) not in existing]
+            self._write(stored, new, position)
+
+    def _write(self, info, reviews, position):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO businesses (id, info, last_review_date, updated) VALUES (?, ?, ?, ?)',
+            (info['id'], sqlite3.Binary(zlib.compress(json.dumps(info))), info.get('last_review_date'),
+             time.time()))
+        self.connection.executemany(
+            'INSERT INTO reviews (business_id, position, user, review, date, rating) VALUES (?, ?, ?, ?, ?, ?)',
+            ((info['id'], position + i) + tuple(r.get(k) for k in self.REVIEW_FIELDS)
+             for i, r in enumerate(reviews)))
+
+    def has_business(self, business_id):
+        with self._lock:
+            return self.connection.execute('SELECT 1 FROM businesses WHERE id = ?', (business_id,)).fetchone() is not None
+
+    def get_business_ids(self):
+
+        """Gets the ids of all the stored businesses.
+
+        Returns:
+            business_ids (list): The stored business ids.
+        """
+
+        with self._lock:
+            return [row[0] for row in self.connection.execute('SELECT id FROM businesses ORDER BY id')]
+
+    def iter_reviews(self):
+
+        """Iterates over every stored review in a single query.
+
+        Returns:
+            rows (generator): (user, review, date, rating, restaurant) tuples.
+        """
+
+        cursor = self.connection.cursor()
+        cursor.execute('SELECT user, review, date, rating, business_id FROM reviews '
+                       'ORDER BY business_id, position')
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def snapshot(self, path):
+
+        """Copies the committed state of the store into a new file.
+
+        The copy reads a single transaction, so a crawl can keep writing to the store
+        while it runs and only the businesses committed before it started are copied.
+        SQLite older than 3.27 has no VACUUM INTO, the store is then copied as a dump.
+
+        Args:
+            path (str): The path of the snapshot, replaced if it exists
+        Returns:
+            snapshot (LocalStore): The snapshot store.
+        """
+
+        if os.path.dirname(path):
+            create_dir(os.path.dirname(path))
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if VACUUM_INTO:
+            with self._lock:
+                self.connection.execute('VACUUM INTO ?', (tmp_path,))
+        else:
+            self._dump(tmp_path)
+        # the write-ahead log of a previous snapshot must not be replayed on this one
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.rename(tmp_path, path)
+        return LocalStore(path)
+
+    def _dump(self, path):
+        # a connection of its own, so the dump reads one transaction while the store is written
+        source = sqlite3.connect(self.path, isolation_level=None)
+        target = sqlite3.connect(path, isolation_level=None)
+        try:
+            source.execute('BEGIN')
+            # the dump starts and commits its own transaction on the target
+            for statement in source.iterdump():
+                target.execute(statement)
+            source.execute('COMMIT')
+        finally:
+            source.close()
+            target.close()
+
+    def content_hash(self):
+
+        """Hashes every stored review, in business and position order.
+
+        Returns:
+            digest (str): The sha1 hex digest of the reviews.
+        """
+
+        digest = hashlib.sha1()
+        for row in self.iter_reviews():
+            digest.update(json.dumps(row))
+            digest.update('\n')
+        return digest.hexdigest()
+
+    def close(self):
+        self.connection.close()
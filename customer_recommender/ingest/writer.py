@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+Background write stage that batches business documents into MongoDB.
+"""
+
+import time
+import Queue
+import threading
+from pymongo import InsertOne, ReplaceOne
+from .scheduler import StopCrawl
+
+
+class WriteError(StopCrawl):
+
+    """A write of the write stage failed, the documents queued since are not written."""
+
+
+class BulkWriter(threading.Thread):
+
+    """Consumes business dictionaries from a bounded queue and writes them in batches.
+
+    The writer runs in its own thread once started. The fetch stage hands documents
+    over with put(), which only blocks when the queue is full, so the database round
+    trips stay off the crawl's critical path. Batches are written unordered, either
+    with insert_many or, in upsert mode, as bulk replacements keyed on the business id.
+    Write operations such as pymongo.UpdateOne can be queued alongside documents, and
+    a document can carry a callback that runs once its batch is written. After a failed
+    write the following batches are dropped and counted, and put() raises WriteError so
+    the crawl stops.
+    """
+
+    _STOP = object()
+
+    def __init__(self, collection, batch_size=50, queue_size=200, flush_interval=5.0, upsert=False):
+        super(BulkWriter, self).__init__(name='BulkWriter')
+        self.daemon = True
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.upsert = upsert
+        self.queue = Queue.Queue(maxsize=queue_size)
+        self.documents = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.error = None
+        self.dropped = 0
+        self._start_time = None
+        self._end_time = None
+
+    def put(self, document, written=None):
+
+        """Queues a document to be written.
+
+        Args:
+            document (dict): A business dictionary or a pymongo write operation
+            written (function): Called without arguments once the document is written, never when its
+                batch fails
+        Returns:
+            None
+        Raises:
+            WriteError: A previous write failed.
+        """
+
+        self.check()
+        self.queue.put((document, written))
+
+    def check(self):
+        if self.error is not None:
+            raise WriteError('writing to {0} failed: {1!r}'.format(self.collection.name, self.error))
+
+    def run(self):
+        self._start_time = time.time()
+        batch = []
+        while True:
+            try:
+                document, written = self.queue.get(timeout=self.flush_interval)
+            except Queue.Empty:
+                # nothing new for a while, write what we have
+                self.flush(batch)
+                batch = []
+                continue
+            if document is self._STOP:
+                break
+            batch.append((document, written))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        self._end_time = time.time()
+
+    def flush(self, batch):
+
+        """Writes a batch of documents.
+
+        Args:
+            batch (list): (document, written) pairs of business dictionaries or write operations and
+                their callbacks
+        Returns:
+            None
+        """
+
+        if not batch:
+            return
+        if self.error is not None:
+            self.dropped += len(batch)
+            return
+        documents = [document for document, _ in batch]
+        start_time = time.time()
+        try:
+            if not self.upsert and all(isinstance(d, dict) for d in documents):
+                self.collection.insert_many(documents, ordered=False)
+            else:
+                self.collection.bulk_write([self.as_operation(d) for d in documents], ordered=False)
+        except Exception as e:
+            self.error = e
+            self.dropped += len(batch)
+            return
+        self.write_seconds += time.time() - start_time
+        self.documents += len(batch)
+        self.batches += 1
+        try:
+            for _, written in batch:
+                if written is not None:
+                    written()
+        except Exception as e:
+            self.error = e
+
+    def as_operation(self, document):
+        if not isinstance(document, dict):
+            return document
+        if self.upsert:
+            return ReplaceOne({'id': document['id']}, document, upsert=True)
+        return InsertOne(document)
+
+    def close(self):
+
+        """Writes the remaining documents and stops the write stage.
+
+        Returns:
+            None
+        Raises:
+            Exception: The first error raised by a write.
+        """
+
+        if self.is_alive():
+            self.queue.put((self._STOP, None))
+            self.join()
+        if self.error is not None:
+            # their callbacks did not run, the businesses stay pending in the journal
+            print ("{0} documents of {1} were not written").format(self.dropped, self.collection.name)
+            raise self.error
+
+    def throughput(self):
+
+        """Gets the number of documents written per second since the write stage started.
+
+        Returns:
+            throughput (float): Documents per second.
+        """
+
+        if self._start_time is None:
+            return 0.0
+        end_time = self._end_time or time.time()
+        return self.documents / max(end_time - self._start_time, 1e-9)
+
+    def stats(self):
+
+        """Reports the write counters.
+
+        Returns:
+            stats (dict): Documents written and dropped, batches written, time spent writing and throughput.
+        """
+
+        return {
+            'documents': self.documents,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'write_seconds': self.write_seconds,
+            'documents_per_second': self.throughput(),
+        }
@@ -1,25 +1,54 @@
 #!/usr/bin/env python
-import json
 import urllib
-import urllib2
 import os
 import time
-import pickle
+import hashlib
 import oauth2
 import unicodedata
-from pymongo import MongoClient
-from ..helper import create_dir, get_soup_from_url
+from pymongo import ReplaceOne, UpdateOne
+from ..client import get_client
+from ..helper import create_dir, get_database, get_html_from_url, get_html_from_urls
+from .extract import get_extractor
+from .store import LocalStore
+from .writer import BulkWriter
+from .scheduler import Acknowledgement, CheckpointJournal, CrawlScheduler, Tile, split_bbox
 from customer_recommender.config import settings
+from customer_recommender import metrics
 
 
 class Yelp(object):
 
     OUTPUTDIR = 'output'
+    STORE_PATH = settings.get('store_path', os.path.join(OUTPUTDIR, 'crawl.db'))
 
     API_HOST = 'api.yelp.com'
     SEARCH_LIMIT = 20
     SEARCH_PATH = '/v2/search/'
     BUSINESS_PATH = '/v2/business/'
+    BUSINESS_URL = 'http://www.yelp.com/biz/'
+
+    # concurrent fetching of review pages (1 fetches pages one at a time)
+    FETCH_WORKERS = int(settings.get('fetch_workers', 1))
+    PER_HOST_CONNECTIONS = int(settings.get('per_host_connections', 4))
+
+    # backend used to extract reviews from review pages ('lxml' or 'bs4')
+    REVIEW_EXTRACTOR = settings.get('review_extractor', 'lxml')
+
+    # batched writes to MongoDB
+    WRITE_BATCH_SIZE = int(settings.get('write_batch_size', 50))
+    WRITE_QUEUE_SIZE = int(settings.get('write_queue_size', 200))
+    REVIEW_BATCH_SIZE = int(settings.get('review_batch_size', 1000))
+
+    # 'full' rebuilds the collection, 'incremental' only merges the new reviews
+    SYNC_MODE = settings.get('sync_mode', 'full')
+
+    # metro area crawls: a [sw_lat, sw_lon, ne_lat, ne_lon] bounding box split into
+    # tiles of TILE_SIZE meters and/or a list of locations, crawled by CRAWL_WORKERS
+    CRAWL_BOUNDS = settings.get('crawl_bounds')
+    CRAWL_LOCATIONS = settings.get('crawl_locations')
+    TILE_SIZE = float(settings.get('tile_size', 1000))
+    CRAWL_WORKERS = int(settings.get('crawl_workers', 1))
+    CHECKPOINT_PATH = settings.get('checkpoint_path', os.path.join(OUTPUTDIR, 'crawl_journal.jsonl'))
 
     # OAuth credential placeholders that must be filled in by users.
     CONSUMER_KEY = settings.get('consumer_key')
@@ -27,16 +56,44 @@ class Yelp(object):
     TOKEN = settings.get('access_token')
     TOKEN_SECRET = settings.get('access_token_secret')
 
-    # use exec in order to combine strings from config file with commands
-    exec 'DB = MongoClient().{0}'.format(settings.get('database'))
-    exec 'COLLECTION = DB.{0}'.format(settings.get('collection'))
+    def __init__(self, location=None, term='restaurants', radius=1000, interactive=True):
+
+        """Sets up a crawl.
+
+        Args:
+            location (str): The location searched when crawl_bounds and crawl_locations are not set.
+            term (str): The search term.
+            radius (int): The radius (in meters) of the search.
+            interactive (bool): Whether to ask for the location when none is given or configured.
+        Raises:
+            ValueError: There is nothing to crawl and interactive is False.
+        """
 
-    def __init__(self):
-        # self.term = raw_input('What food would you like to search for? ')
-        self.term = 'restaurants'
-        self.location = raw_input('What is your location? ').replace(" ", "")
-        # self.radius = raw_input('What is your search radius (in meters)? ')
-        self.radius = 1000
+        self.term = term
+        self.location = location.replace(" ", "") if location else None
+        if not (self.location or self.CRAWL_BOUNDS or self.CRAWL_LOCATIONS):
+            if not interactive:
+                raise ValueError("Nothing to crawl, give a location or set crawl_bounds or crawl_locations")
+            self.location = raw_input('What is your location? ').replace(" ", "")
+        self.radius = radius
+
+        # signing state and connections are reused across requests
+        self.client = get_client()
+        self.consumer = oauth2.Consumer(self.CONSUMER_KEY, self.CONSUMER_SECRET)
+        self.token = oauth2.Token(self.TOKEN, self.TOKEN_SECRET)
+        self.signature_method = oauth2.SignatureMethod_HMAC_SHA1()
+        self.extractor = get_extractor(self.REVIEW_EXTRACTOR)
+        self.store = LocalStore(self.STORE_PATH)
+
+    @property
+    def collection(self):
+        # one document per business, connected on first use
+        return get_database()[settings.get('collection', 'review_collection')]
+
+    @property
+    def reviews(self):
+        # one document per review, next to the per-business documents
+        return get_database()[settings.get('reviews_collection', 'reviews')]
 
     def request(self, host, path, url_params=None):
 
@@ -49,35 +106,71 @@ class Yelp(object):
         Returns:
             dict: The JSON response from the request.
         Raises:
-            urllib2.HTTPError: An error occurs from the HTTP request.
+            requests.HTTPError: An error occurs from the HTTP request.
+            CacheMiss: The response is not cached and the crawler runs offline.
         """
         url_params = url_params or {}
         url = 'https://{0}{1}?'.format(host, urllib.quote(path.encode('utf8')))
 
-        consumer = oauth2.Consumer(self.CONSUMER_KEY, self.CONSUMER_SECRET)
-        oauth_request = oauth2.Request(method="GET", url=url, parameters=url_params)
-
-        oauth_request.update(
-            {
-                'oauth_nonce': oauth2.generate_nonce(),
-                'oauth_timestamp': oauth2.generate_timestamp(),
-                'oauth_token': self.TOKEN,
-                'oauth_consumer_key': self.CONSUMER_KEY
-            }
-        )
-        token = oauth2.Token(self.TOKEN, self.TOKEN_SECRET)
-        oauth_request.sign_request(oauth2.SignatureMethod_HMAC_SHA1(), consumer, token)
-        signed_url = oauth_request.to_url()
-
-        conn = urllib2.urlopen(signed_url, None)
-        try:
-            response = json.loads(conn.read())
-        finally:
-            conn.close()
+        def sign():
+            # every attempt gets a fresh nonce and timestamp
+            oauth_request = oauth2.Request(method="GET", url=url, parameters=url_params)
+
+            oauth_request.update(
+                {
+                    'oauth_nonce': oauth2.generate_nonce(),
+                    'oauth_timestamp': oauth2.generate_timestamp(),
+                    'oauth_token': self.TOKEN,
+                    'oauth_consumer_key': self.CONSUMER_KEY
+                }
+            )
+            oauth_request.sign_request(self.signature_method, self.consumer, self.token)
+            return oauth_request.to_url()
 
-        return response
+        # search results and business details are cached with different lifetimes
+        resource = 'search' if path.startswith(self.SEARCH_PATH) else 'business'
+        return self.client.get_json(sign(), resource=resource, sign=sign)
 
-    def get_business_ids(self, term, location, radius, maxlimit=10000):
+    def get_search_params(self, term, location=None, radius=None, bounds=None):
+
+        """Builds the query parameters of a search.
+
+        Args:
+            term (str): The search term.
+            location (str): The location to search for.
+            radius (int): The radius (in meters) for the search.
+            bounds (str): A 'sw_lat,sw_lon|ne_lat,ne_lon' bounding box searched instead of a location.
+        Returns:
+            url_params (dict): The query parameters, without the paging ones.
+        """
+
+        url_params = {'term': term.replace(' ', '+')}
+        if bounds is not None:
+            url_params['bounds'] = bounds
+        else:
+            url_params['location'] = location.replace(' ', '+')
+            url_params['radius_filter'] = radius
+        return url_params
+
+    def get_search_total(self, term, location=None, radius=None, bounds=None):
+
+        """Gets the total number of businesses matching a search.
+
+        Args:
+            term (str): The search term.
+            location (str): The location to search for.
+            radius (int): The radius (in meters) for the search.
+            bounds (str): A 'sw_lat,sw_lon|ne_lat,ne_lon' bounding box searched instead of a location.
+        Returns:
+            total (int): The number of matching businesses.
+        """
+
+        url_params = self.get_search_params(term, location, radius, bounds)
+        url_params.update({'limit': 20, 'offset': 0})
+        output = self.request(self.API_HOST, self.SEARCH_PATH, url_params=url_params)
+        return int(output.get('total', len(output['businesses'])))
+
+    def get_business_ids(self, term, location, radius, maxlimit=10000, bounds=None):
 
         """Function to get the business_ids from the yelp API.
 
@@ -86,6 +179,7 @@ class Yelp(object):
             location (str): The location to search for.
             radius (int): The radius (in meters) for the search.
             maxlimit (int): An optional set of query parameters in the request for maximim results returned. (Max is 20)
+            bounds (str): A 'sw_lat,sw_lon|ne_lat,ne_lon' bounding box searched instead of a location.
         Returns:
             businesses (list): A list of all the business_ids for the search.
 
@@ -97,13 +191,11 @@ class Yelp(object):
 
         # iterate and collect business ids from Yelp
         while resume and offset < 1000:
-            url_params = {
-                'term': term.replace(' ', '+'),
-                'location': location.replace(' ', '+'),
+            url_params = self.get_search_params(term, location, radius, bounds)
+            url_params.update({
                 'limit': 20,
-                'radius_filter': radius,
                 'offset': offset
-            }
+            })
             output = self.request(self.API_HOST, self.SEARCH_PATH, url_params=url_params)
             n_records = len(output['businesses'])
             # last set of businesses
@@ -134,90 +226,133 @@ class Yelp(object):
 
         return self.request(self.API_HOST, business_path)
 
-    def get_business_url(self, business_id, base='http://www.yelp.com/biz/'):
+    def get_business_url(self, business_id, base=None):
 
         """Takes business_id and returns the url for a business.
 
         Args:
             business_id (str): A unique business id for each Yelp business
+            base (str): An optional base url, defaults to BUSINESS_URL
         Returns:
             business_url (str): The url for the Yelp business.
 
         """
 
-        business_url = base + business_id
+        business_url = (base or self.BUSINESS_URL) + business_id
         return business_url
 
-    def get_number_reviews(self, business_id):
+    def get_number_reviews(self, business_id, page=None):
 
         """Gets the unique number of reviews for a business.
 
         Args:
             business_id (str): A unique business id for each Yelp business
+            page (unicode): An optional, already fetched first review page
         Returns:
             number_reviews (int): The unique number of reviews for a business.
         """
 
-        url = self.get_business_url(business_id)
-        soup = get_soup_from_url(url)
-        number_reviews = int(soup.find(itemprop='reviewCount').text)
+        if page is None:
+            page = get_html_from_url(self.get_business_url(business_id))
+        with metrics.TIMERS.timed('parse'):
+            number_reviews = self.extractor.get_number_reviews(page)
         return number_reviews
 
-    def get_business_review_info(self, business_id, max_limit=20):
+    def get_review_page_urls(self, business_id, num_reviews, max_limit=20, sort_by=None):
+
+        """Gets the urls of all the review pages for a business.
+
+        Args:
+            business_id (str): A unique business id for each Yelp business
+            num_reviews (int): The unique number of reviews for a business
+            max_limit (int): Maximum number of reviews on a single page
+            sort_by (str): An optional sort order of the reviews, e.g. 'date_desc'
+        Returns:
+            urls (list): The review page urls, in page order.
+        """
+
+        url = self.get_business_url(business_id)
+        urls = [url]
+        for counter in range(max_limit, num_reviews + 1, max_limit):
+            urls.append('{0}?start={1}'.format(url, counter))
+        if sort_by:
+            urls = ['{0}{1}sort_by={2}'.format(u, '&' if '?' in u else '?', sort_by) for u in urls]
+        return urls
+
+    def get_review_info(self, page):
+
+        """Gets the reviews from a single review page.
+
+        Args:
+            page (unicode): The html of a review page
+        Returns:
+            reviews (list): A list of dictionaries. Each dictionary contains a single review by
+            user containing the date, the review, and the rating.
+        """
+
+        with metrics.TIMERS.timed('parse'):
+            return self.extractor.get_reviews(page)
+
+    def get_business_review_info(self, business_id, max_limit=20, workers=None, since=None):
 
         """Gets the unique reviews for a business.
 
         Args:
             business_id (str): A unique business id for each Yelp business
             max_limit (int): Maximum number of requests that can be retrieved
+            workers (int): Number of review pages fetched concurrently, defaults to FETCH_WORKERS
+            since (str): An optional 'YYYY-MM-DD' date, only reviews from that date on are
+                retrieved and paging stops at the first page reaching older reviews
         Returns:
             reviews (list): A list of dictionaries. Each dictionary contains a single review by
             user containing the date, the review, and the rating.
         """
 
-        url = self.get_business_url(business_id)
-        new_url = url
-        num_reviews = self.get_number_reviews(business_id)
-        counter = 0
-        reviews = []
-
-        # use a counter to iterate through the url pages
-        while counter <= num_reviews:
-            soup = get_soup_from_url(new_url)
-            for review in soup.find_all(class_='review--with-sidebar'):
-                review_dict = {}
-                # get user info
-                try:
-                    user = review.find(class_='user-display-name').attrs.get('href')
-                    review_dict['user'] = user
-                except:
-                    pass
-                # get review
-                try:
-                    rev = review.find(itemprop='description').text
-                    review_dict['review'] = rev
-                except:
-                    pass
-                # get review date
-                try:
-                    date = review.find(itemprop='datePublished').attrs.get('content')
-                    review_dict['date'] = date
-                    # review_dict['date'] = datetime.strptime(date,'%Y-%m-%d')
-                except:
-                    pass
-                # get review rating
-                try:
-                    rating = review.find(itemprop='ratingValue').attrs.get('content')
-                    review_dict['rating'] = float(rating)
-                except:
-                    pass
-                # only append if review dict is not empty
-                if len(review_dict) != 0:
-                    reviews.append(review_dict)
-            # increment counter and update url
-            counter += max_limit
-            new_url = '{0}?start={1}'.format(url, counter)
-        return reviews
+        if workers is None:
+            workers = self.FETCH_WORKERS
+        # newest reviews first, so that an incremental crawl can stop early
+        sort_by = 'date_desc' if since is not None else None
+
+        # the first page also carries the review count, so it is only fetched once
+        first_page = get_html_from_url(self.get_review_page_urls(business_id, 0, max_limit, sort_by)[0])
+        num_reviews = self.get_number_reviews(business_id, page=first_page)
+        urls = self.get_review_page_urls(business_id, num_reviews, max_limit, sort_by)
+
+        reviews = self.get_review_info(first_page)
+        if since is None:
+            for page in get_html_from_urls(urls[1:], workers=workers, per_host=self.PER_HOST_CONNECTIONS):
+                reviews.extend(self.get_review_info(page))
+            return reviews
+
+        # fetch pages a window at a time until a page reaches reviews older than since
+        remaining = urls[1:]
+        reached = self._reached_date(reviews, since)
+        while remaining and not reached:
+            window, remaining = remaining[:max(workers, 1)], remaining[max(workers, 1):]
+            for page in get_html_from_urls(window, workers=workers, per_host=self.PER_HOST_CONNECTIONS):
+                page_reviews = self.get_review_info(page)
+                reviews.extend(page_reviews)
+                reached = self._reached_date(page_reviews, since)
+                if reached:
+                    break
+        return [review for review in reviews if review.get('date') >= since]
+
+    @staticmethod
+    def _reached_date(reviews, since):
+        return any(review.get('date') and review['date'] < since for review in reviews)
+
+    def get_last_review_date(self, reviews):
+
+        """Gets the date of the most recent review.
+
+        Args:
+            reviews (list): A list of review dictionaries
+        Returns:
+            date (str): The most recent 'YYYY-MM-DD' date, or None if no review is dated.
+        """
+
+        dates = [review['date'] for review in reviews if review.get('date')]
+        return max(dates) if dates else None
 
     def create_business_dictionary(self, business_id):
 
@@ -229,17 +364,14 @@ class Yelp(object):
             d (dict): A dictionary for a given business
         """
 
-        # creates outputdir and check to see if output path exists
-        outputdir = os.path.join(self.OUTPUTDIR, 'business_dicts')
-        create_dir(outputdir)
-        output_file = os.path.join(outputdir, '{0}.p'.format(business_id))
-
-        # check to see if file exists
-        try:
+        # check to see if the business was already crawled
+        d = self.store.get_business(business_id)
+        if d is not None:
             # if exists load from local
-            d = pickle.load(open('{0}'.format(output_file), 'rb'))
             print "Loading {0} dictionary from local".format(business_id)
-        except:
+            if 'last_review_date' not in d:
+                d['last_review_date'] = self.get_last_review_date(d['reviews'])
+        else:
             # get the data from source
             print ("Processing {0} dictionary...").format(business_id)
             d = {}
@@ -249,47 +381,221 @@ class Yelp(object):
             # overwrites reviews
             d['reviews'] = self.get_business_review_info(business_id)
             d['id'] = business_id
-            pickle.dump(d, open('{0}'.format(output_file), 'wb'))
-            print (">>> Output saved to {0}").format(output_file)
+            d['last_review_date'] = self.get_last_review_date(d['reviews'])
+            self.store.put_business(d)
+            print (">>> Output saved to {0}").format(self.store.path)
+        return d
+
+    def ensure_review_indexes(self):
 
-    def load_mongodb_data(self, db, collection, business_id):
+        """Creates the indexes of the one-document-per-review collection.
 
-        """Loads data into a MongoDB
+        Returns:
+            None
+        """
+
+        self.reviews.create_index('user')
+        self.reviews.create_index('restaurant')
+        self.reviews.create_index('date')
+
+    def get_review_documents(self, business_id, reviews, position=0):
+
+        """Creates the upserts of the one-document-per-review collection.
 
         Args:
-            db (str): MongoDB database name
-            collection (str): MongoDB collection name
             business_id (str): A unique business id for each Yelp business
+            reviews (list): Review dictionaries of the business
+            position (int): Position of the first review on the business pages
         Returns:
-            None
+            upserts (list): A pymongo.ReplaceOne per review, keyed on a hash of the review.
+        """
+
+        upserts = []
+        for i, review in enumerate(reviews):
+            key = u'\x00'.join(unicode(review.get(k) or u'') for k in ('user', 'date', 'review'))
+            document = dict(review)
+            document['restaurant'] = business_id
+            document['position'] = position + i
+            document['_id'] = hashlib.sha1(u'{0}\x00{1}'.format(business_id, key).encode('utf-8')).hexdigest()
+            upserts.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+        return upserts
+
+    def get_sync_state(self):
+
+        """Gets the date of the last review seen for every business already in the collection.
+
+        Returns:
+            state (dict): The last review date keyed by business id.
         """
 
-        # load from pickle and insert collection into database
-        f = os.path.join(self.OUTPUTDIR, 'business_dicts', '{0}.p'.format(business_id))
-        with open(f, 'r') as infile:
-            dictionary = pickle.load(infile)
-            self.COLLECTION.insert_one(dictionary)
+        cursor = self.collection.find({}, {'id': 1, 'last_review_date': 1, '_id': 0})
+        return dict((d['id'], d.get('last_review_date')) for d in cursor if 'id' in d)
+
+    def get_business_update(self, business_id, since):
+
+        """Creates the upsert merging the reviews posted since the last crawl into a business.
+
+        Args:
+            business_id (str): A unique business id for each Yelp business
+            since (str): The 'YYYY-MM-DD' date of the last review seen for the business
+        Returns:
+            update (pymongo.UpdateOne): The upsert of the business.
+            reviews (list): The reviews merged into the business.
+        """
+
+        print ("Updating {0} with reviews since {1}...").format(business_id, since)
+        info = self.get_business(business_id)
+        info.pop('reviews', None)
+        reviews = self.get_business_review_info(business_id, since=since)
+        info['id'] = business_id
+        info['last_review_date'] = max(since, self.get_last_review_date(reviews))
+        self.store.merge_reviews(business_id, info, reviews)
+        # $addToSet skips the reviews of the last crawled day that are already stored
+        update = UpdateOne({'id': business_id},
+                           {'$set': info, '$addToSet': {'reviews': {'$each': reviews}}},
+                           upsert=True)
+        return update, reviews
+
+    def get_tiles(self):
+
+        """Gets the tiles of the area to crawl.
+
+        Returns:
+            tiles (list): The location given or asked for, or the tiles of crawl_bounds and crawl_locations.
+        """
+
+        if self.location:
+            return [Tile.from_location(self.location)]
+        tiles = []
+        if self.CRAWL_BOUNDS:
+            tiles.extend(split_bbox(self.CRAWL_BOUNDS, self.TILE_SIZE))
+        for location in self.CRAWL_LOCATIONS or []:
+            tiles.append(Tile.from_location(location))
+        return tiles
+
+    def process_business(self, business_id, state, writer, review_writer, written=None):
+
+        """Crawls a business and queues its documents for the write stage.
+
+        Args:
+            business_id (str): A unique business id for each Yelp business
+            state (dict): The last review date keyed by business id, for incremental updates
+            writer (BulkWriter): The write stage of the business documents
+            review_writer (BulkWriter): The write stage of the review documents
+            written (function): Called once the business and all of its reviews are written
+        Returns:
+            n_reviews (int): The number of reviews crawled.
+        Raises:
+            WriteError: A write of the write stage failed, the crawl stops.
+        """
+
+        # nothing is fetched once a write failed
+        writer.check()
+        review_writer.check()
+        print ("Begin {}...".format(business_id))
+        # a business missing from the local store is crawled in full, a merge would leave it partial there
+        if state.get(business_id) and self.store.has_business(business_id):
+            document, reviews = self.get_business_update(business_id, state[business_id])
+        else:
+            document = self.create_business_dictionary(business_id)
+            reviews = document['reviews']
+        upserts = self.get_review_documents(business_id, reviews)
+        # batches are written in order, the last review written means all of them are
+        done = Acknowledgement(written, 2 if upserts else 1) if written is not None else None
+        writer.put(document, done)
+        for i, upsert in enumerate(upserts):
+            review_writer.put(upsert, done if i == len(upserts) - 1 else None)
+        print ("Processing {} successful!".format(business_id))
+        return len(reviews)
 
     def main(self):
         start_time = time.time()
         print ("Getting your restaurant reviews...")
         create_dir(self.OUTPUTDIR)
 
-        # clear collection
-        print ("Clearing data from MongoDB...")
-        self.COLLECTION.drop()
+        journal = CheckpointJournal(self.CHECKPOINT_PATH)
+        resume = journal.exists()
+        incremental = self.SYNC_MODE == 'incremental'
+        with metrics.stage('prepare') as stage:
+            stage.set('sync_mode', self.SYNC_MODE)
+            stage.set('resume', resume)
+            if incremental:
+                print ("Reading last review dates from MongoDB...")
+                state = self.get_sync_state()
+                stage.count('businesses', len(state))
+            elif resume:
+                print ("Resuming the crawl recorded in {0}...".format(self.CHECKPOINT_PATH))
+                state = {}
+            else:
+                # clear collection
+                print ("Clearing data from MongoDB...")
+                self.collection.drop()
+                self.reviews.drop()
+                state = {}
+            self.ensure_review_indexes()
+
+        # scrape and hand the dictionaries over to the write stage
+        writer = BulkWriter(self.collection, batch_size=self.WRITE_BATCH_SIZE, queue_size=self.WRITE_QUEUE_SIZE,
+                            upsert=incremental or resume)
+        review_writer = BulkWriter(self.reviews, batch_size=self.REVIEW_BATCH_SIZE,
+                                   queue_size=self.REVIEW_BATCH_SIZE * 4)
+        writer.start()
+        review_writer.start()
 
-        # scrape and load into MongoDB
-        for business_id in self.get_business_ids(self.term, self.location, self.radius):
-            print ("Begin {}...".format(business_id))
-            self.create_business_dictionary(business_id)
+        try:
+            with metrics.stage('crawl') as crawl:
+
+                def handle(business_id, written):
+                    crawl.count('reviews', self.process_business(business_id, state, writer, review_writer,
+                                                                 written))
+                    crawl.count('businesses')
+
+                scheduler = CrawlScheduler(self, self.get_tiles(), journal, workers=self.CRAWL_WORKERS)
+                errors = scheduler.run(handle)
+                crawl.count('failed_tiles', len(errors))
+                # fetching, parsing and writing overlap, their totals are logged next to the wall time
+                crawl.set('timers', metrics.TIMERS.stats())
+                crawl.set('hosts', self.client.latency_stats())
+                crawl.set('rates', self.client.rate_stats())
+                if self.client.cache is not None:
+                    crawl.set('cache', {'hits': self.client.cache.hits, 'misses': self.client.cache.misses})
+            if errors:
+                print ("{0} tiles failed, run again to resume from {1}").format(len(errors), self.CHECKPOINT_PATH)
+        finally:
+            # the queued documents are written even when the crawl fails
             print ("Loading data into MongoDB...")
-            self.load_mongodb_data(self.DB, self.COLLECTION, business_id)
-            print ("Loading data into MongoDB complete!")
-            print ("Processing {} successful!".format(business_id))
+            with metrics.stage('load') as load:
+                try:
+                    writer.close()
+                finally:
+                    review_writer.close()
+                load.set('businesses', writer.stats())
+                load.set('reviews', review_writer.stats())
+        if not errors:
+            # every business is written, the next run starts from scratch
+            journal.clear()
+        print ("Loaded {documents} businesses in {batches} batches ({documents_per_second:.1f} documents/sec)".format(
+            **writer.stats()))
+        print ("Loaded {documents} reviews in {batches} batches ({documents_per_second:.1f} documents/sec)".format(
+            **review_writer.stats()))
+
+        # confirm that connections were reused
+        for host, counters in sorted(self.client.stats().items()):
+            print ("{0}: {1} requests over {2} connections ({3} reused)").format(
+                host, counters['requests'], counters['connections'], counters['reused'])
+        for host, latency in sorted(self.client.latency_stats().items()):
+            print ("{0}: latency p50 {1:.3f}s, p95 {2:.3f}s, max {3:.3f}s").format(
+                host, latency['p50'], latency['p95'], latency['max'])
+        if self.client.cache is not None:
+            print ("Response cache: {0} hits, {1} misses").format(self.client.cache.hits, self.client.cache.misses)
+        for resource, counters in sorted(self.client.rate_stats().items()):
+            print ("{0}: {1} requests, {2} errors, {3} retries, final rate {4:.2f}/sec").format(
+                resource, counters['requests'], counters['errors'], counters['retries'], counters['rate'])
 
         # time to run
         print ("--- %s seconds ---") % (time.time() - start_time)
+        if metrics.get_log().path:
+            print ("Stage metrics appended to {0}").format(metrics.get_log().path)
         print ("Dictionaries created successfully!")
 
 if __name__ == "__main__":
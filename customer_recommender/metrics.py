@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+Per-stage metrics of the pipeline, written as JSON lines, and optional cProfile dumps.
+
+Wrap a stage in metrics.stage():
+
+    with metrics.stage('tokenize') as s:
+        tokenized = tokenize_corpora(reviews)
+        s.count('users', len(reviews))
+
+Every stage appends a line with its wall time, CPU time, peak memory and counts to
+metrics_path. Set CUSTOMER_RECOMMENDER_PROFILE to 'all' (or to a comma separated list
+of stage names) to also profile stages into profile_dir, one .prof file per stage.
+"""
+
+import os
+import json
+import time
+import cProfile
+import resource
+import threading
+from contextlib import contextmanager
+from customer_recommender.config import settings
+from customer_recommender.helper import create_dir
+
+PROFILE_ENV = 'CUSTOMER_RECOMMENDER_PROFILE'
+
+# every stage of a process is logged under the same run id
+RUN_ID = '{0}-{1}'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid())
+
+
+def _cpu_seconds():
+    # user and system time of every thread of the process
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Timers(object):
+
+    """Thread-safe totals of time spent in sub-stages that run concurrently, e.g. parsing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def add(self, name, seconds, n=1):
+        with self._lock:
+            total = self._totals.setdefault(name, {'seconds': 0.0, 'count': 0})
+            total['seconds'] += seconds
+            total['count'] += n
+
+    @contextmanager
+    def timed(self, name):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start_time)
+
+    def stats(self):
+        with self._lock:
+            return dict((name, dict(total)) for name, total in self._totals.items())
+
+
+TIMERS = Timers()
+
+
+class Stage(object):
+
+    """The counts and extra fields of a stage, filled in while it runs, from any thread."""
+
+    def __init__(self, name, counts=None):
+        self.name = name
+        self.counts = dict(counts or {})
+        self.fields = {}
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def set(self, key, value):
+        self.fields[key] = value
+
+
+class MetricsLog(object):
+
+    """Append-only JSON lines log of stage metrics."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        if not self.path:
+            return
+        with self._lock:
+            if os.path.dirname(self.path):
+                create_dir(os.path.dirname(self.path))
+            with open(self.path, 'a') as outfile:
+                outfile.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+_LOG = None
+
+
+def get_log():
+
+    """Returns the metrics log of the process, configured from the settings.
+
+    Returns:
+        log (MetricsLog): The metrics log, metrics_path set to null disables it.
+    """
+
+    global _LOG
+    if _LOG is None:
+        _LOG = MetricsLog(settings.get('metrics_path', os.path.join('output', 'metrics.jsonl')))
+    return _LOG
+
+
+def profiling(name):
+
+    """Checks whether a stage is profiled.
+
+    Args:
+        name (str): The name of the stage
+    Returns:
+        profiled (bool): True when the profiling environment flag is 'all', '1' or lists the stage.
+    """
+
+    flag = os.environ.get(PROFILE_ENV, '').strip()
+    if not flag:
+        return False
+    if flag.lower() in ('1', 'all', 'true'):
+        return True
+    return name in [stage.strip() for stage in flag.split(',')]
+
+
+@contextmanager
+def stage(name, log=None, **counts):
+
+    """Measures a stage and logs its metrics when it ends, also when it raises.
+
+    Only the calling thread is profiled, the time of worker threads shows up as waits.
+
+    Args:
+        name (str): The name of the stage
+        log (MetricsLog): The log written to, get_log() by default
+        counts: Initial item counts of the stage
+    Returns:
+        stage (Stage): The stage, to add counts and fields while it runs.
+    """
+
+    current = Stage(name, counts)
+    profiler = cProfile.Profile() if profiling(name) else None
+    start_peak = _peak_mb()
+    start_cpu = _cpu_seconds()
+    start_time = time.time()
+    status = 'ok'
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield current
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        current.seconds = time.time() - start_time
+        record = {
+            'run': RUN_ID,
+            'stage': name,
+            'status': status,
+            'start': start_time,
+            'wall_seconds': current.seconds,
+            'cpu_seconds': _cpu_seconds() - start_cpu,
+            'peak_mb': _peak_mb(),
+            'peak_growth_mb': _peak_mb() - start_peak,
+            'counts': current.counts,
+        }
+        record.update(current.fields)
+        if profiler is not None:
+            directory = settings.get('profile_dir', os.path.join('output', 'profiles'))
+            create_dir(directory)
+            record['profile'] = os.path.join(directory, '{0}-{1}.prof'.format(RUN_ID, name))
+            profiler.dump_stats(record['profile'])
+        (log or get_log()).write(record)
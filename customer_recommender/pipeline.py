@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""
+Runs the crawl, the clustering and the web app, skipping the stages that are up to date.
+
+    $ python -m customer_recommender.pipeline              # crawl and cluster what changed
+    $ python -m customer_recommender.pipeline cluster      # cluster the reviews if they changed
+    $ python -m customer_recommender.pipeline --force ingest --serve
+
+The content hash of the inputs and outputs of every stage is recorded in pipeline_state.
+A stage is skipped when the hash of its inputs did not change and its outputs are still
+the ones it wrote:
+
+    ingest   inputs: the crawl settings          outputs: the crawl store content
+    cluster  inputs: the reviews read            outputs: the token cache, model, stem index,
+             and the wrangle settings                     data.csv and the web page artifact
+
+The crawl is refreshed when it is older than crawl_max_age hours. Clustering reads the
+reviews from review_source, as the cluster command does. With review_source: local it
+reads a snapshot of the committed businesses of the crawl store, so it can run while a
+new crawl is still writing.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from customer_recommender import metrics
+from customer_recommender.config import settings
+from customer_recommender.helper import create_dir
+
+STAGES = ('ingest', 'cluster')
+
+# the settings each stage depends on
+INGEST_SETTINGS = ('crawl_bounds', 'crawl_locations', 'tile_size', 'sync_mode', 'database', 'collection',
+                   'reviews_collection')
+CLUSTER_SETTINGS = ('review_source', 'features', 'hash_features', 'svd_components', 'cluster_engine',
+                    'num_clusters', 'cluster_batch_size', 'cluster_mode', 'refit_days', 'refit_drift')
+
+DATA_CSV = os.path.join('customer_recommender', 'visualize', 'static', 'data.csv')
+ARTIFACT_INDEX = os.path.join('customer_recommender', 'visualize', 'static', 'artifact', 'index.json')
+
+
+def file_hash(path):
+    """Function to hash the content of a file
+
+    Args:
+        path (str): The path of the file
+    Returns:
+        digest (str): The sha1 hex digest of the file, or None if it does not exist
+
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_hash(*frames):
+    """Function to hash the rows of dataframes in the order they were read, None frames are skipped"""
+
+    digest = hashlib.sha1()
+    for df in frames:
+        if df is None:
+            continue
+        for row in df.itertuples():
+            digest.update(json.dumps(row, default=str))
+            digest.update('\n')
+    return digest.hexdigest()
+
+
+def settings_hash(keys, *values):
+    """Function to hash a set of settings and extra values"""
+
+    data = dict((key, settings.get(key)) for key in keys)
+    data['_values'] = values
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str)).hexdigest()
+
+
+class PipelineState(object):
+
+    """The hashes recorded by the last successful run of every stage, kept in a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r') as infile:
+                self.stages = json.load(infile)
+
+    def up_to_date(self, stage, inputs):
+
+        """Checks whether a stage can be skipped.
+
+        Args:
+            stage (str): The name of the stage
+            inputs (str): The hash of the current inputs of the stage
+        Returns:
+            up_to_date (bool): True when the inputs did not change and the outputs were not modified since.
+        """
+
+        recorded = self.stages.get(stage)
+        if not recorded or recorded['inputs'] != inputs:
+            return False
+        return all(file_hash(path) == digest for path, digest in recorded['outputs'].items())
+
+    def record(self, stage, inputs, outputs, **fields):
+
+        """Records a successful run of a stage.
+
+        Args:
+            stage (str): The name of the stage
+            inputs (str): The hash of the inputs of the stage
+            outputs (list): The paths of the files the stage wrote, hashed now
+            fields: Extra fields kept with the stage
+        Returns:
+            None
+        """
+
+        entry = {'inputs': inputs, 'outputs': dict((path, file_hash(path)) for path in outputs),
+                 'finished': time.time()}
+        entry.update(fields)
+        self.stages[stage] = entry
+        if os.path.dirname(self.path):
+            create_dir(os.path.dirname(self.path))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(self.stages, outfile, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+class Pipeline(object):
+
+    def __init__(self, state=None, location=None, interactive=True, config_args=()):
+        self.location = location
+        self.interactive = interactive
+        # the --config and --set arguments of the command line, the server process applies them too
+        self.config_args = list(config_args)
+        self.state = state or PipelineState(settings.get('pipeline_state', os.path.join('output', 'pipeline.json')))
+        self.store_path = settings.get('store_path', os.path.join('output', 'crawl.db'))
+        self.snapshot_path = settings.get('snapshot_path', os.path.join('output', 'snapshot.db'))
+
+    def ingest(self, force=False):
+
+        """Crawls Yelp unless the last crawl is recent and used the same settings.
+
+        Args:
+            force (bool): Whether to crawl even when the last crawl is up to date
+        Returns:
+            ran (bool): Whether the crawl ran.
+        """
+
+        from customer_recommender.ingest.scheduler import CheckpointJournal
+        inputs = settings_hash(INGEST_SETTINGS)
+        recorded = self.state.stages.get('ingest', {})
+        max_age = float(settings.get('crawl_max_age', 24)) * 3600
+        fresh = time.time() - recorded.get('finished', 0) < max_age
+        # an interrupted crawl always resumes
+        journal = CheckpointJournal(settings.get('checkpoint_path', os.path.join('output', 'crawl_journal.jsonl')))
+        if not force and fresh and not journal.exists() and recorded.get('inputs') == inputs:
+            print "Crawl is up to date, skipping ingest"
+            return False
+
+        from customer_recommender.ingest.yelp import Yelp
+        Yelp(location=self.location, interactive=self.interactive).main()
+        from customer_recommender.ingest.store import LocalStore
+        store = LocalStore(self.store_path)
+        self.state.record('ingest', inputs, [], crawl=store.content_hash())
+        store.close()
+        return True
+
+    def cluster(self, force=False):
+
+        """Clusters the reviews of review_source unless they and the settings did not change.
+
+        With review_source: local a snapshot of the crawl store is clustered, so a crawl can
+        keep writing to it. The MongoDB sources are read as the cluster command reads them,
+        and the hash of the reviews read decides whether they changed.
+
+        Args:
+            force (bool): Whether to cluster even when the outputs are up to date
+        Returns:
+            ran (bool): Whether the clustering ran.
+        """
+
+        from customer_recommender.wrangle import cluster_data
+
+        user_summary = None
+        if settings.get('review_source', 'mongodb') == 'local':
+            from customer_recommender.ingest.store import LocalStore
+            with metrics.stage('snapshot') as stage:
+                store = LocalStore(self.store_path)
+                snapshot = store.snapshot(self.snapshot_path)
+                store.close()
+                crawl = snapshot.content_hash()
+                stage.set('crawl', crawl)
+            inputs = settings_hash(CLUSTER_SETTINGS, crawl)
+            if not force and self.state.up_to_date('cluster', inputs):
+                print "Clusters are up to date with crawl {0}, skipping cluster".format(crawl[:12])
+                snapshot.close()
+                return False
+            with metrics.stage('load_reviews') as stage:
+                df = cluster_data.get_local_dataframe(snapshot)
+                stage.count('reviews', len(df))
+            snapshot.close()
+        else:
+            with metrics.stage('load_reviews') as stage:
+                df, user_summary = cluster_data.load_reviews()
+                crawl = frame_hash(df, user_summary)
+                stage.count('reviews', len(df))
+                stage.set('crawl', crawl)
+            inputs = settings_hash(CLUSTER_SETTINGS, crawl)
+            if not force and self.state.up_to_date('cluster', inputs):
+                print "Clusters are up to date with reviews {0}, skipping cluster".format(crawl[:12])
+                return False
+        cluster_data.main(df=df, user_summary=user_summary)
+
+        outputs = [DATA_CSV, ARTIFACT_INDEX,
+                   settings.get('model_pickle', os.path.join('output', 'model.pickle')),
+                   settings.get('stem_index_path', os.path.join('output', 'stem_index.json')),
+                   settings.get('token_cache', os.path.join('output', 'tokens.pickle'))]
+        self.state.record('cluster', inputs, [path for path in outputs if path], crawl=crawl)
+        return True
+
+    def serve(self):
+        # the server runs in its own process, without the memory of the clustering
+        return subprocess.call([sys.executable, '-m', 'customer_recommender.cli'] + self.config_args + ['serve'])
+
+    def run(self, stages=STAGES, force=(), serve=False):
+        for stage in stages:
+            getattr(self, stage)(force=stage in force)
+        if serve:
+            self.serve()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the stages of the pipeline that are not up to date')
+    parser.add_argument('stages', nargs='*', help='stages to run: {0} (default: all)'.format(', '.join(STAGES)))
+    parser.add_argument('--force', action='append', default=[], choices=STAGES, help='run a stage even if up to date')
+    parser.add_argument('--serve', action='store_true', help='launch the web app at the end')
+    parser.add_argument('--location', help='location to crawl instead of crawl_bounds and crawl_locations')
+    args = parser.parse_args(argv)
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error('unknown stages: {0}'.format(', '.join(sorted(unknown))))
+    Pipeline(location=args.location, interactive=False).run(args.stages or STAGES, force=args.force, serve=args.serve)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+Token bucket rate limiting, adaptive to errors and latency, and jittered
+exponential backoff for the crawler's requests.
+"""
+
+import time
+import random
+import threading
+from collections import deque
+
+
+class TokenBucket(object):
+
+    """Lets through at most rate requests per second, with bursts of up to capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+
+        """Blocks until a request is allowed.
+
+        Returns:
+            waited (float): The time spent waiting (in seconds).
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveRateLimiter(TokenBucket):
+
+    """A token bucket whose rate follows the health of the endpoint.
+
+    The rate grows additively while responses are fast and successful, and is cut
+    multiplicatively on throttling (429), server errors (5xx), connection errors and
+    responses slower than target_latency. The observed rate is measured over the
+    requests of the last window seconds, older ones are dropped as requests come in.
+    """
+
+    def __init__(self, max_rate, min_rate=0.2, target_latency=2.0, increase=0.1, decrease=0.5, window=10.0):
+        super(AdaptiveRateLimiter, self).__init__(max_rate / 2.0, capacity=max(max_rate, 1))
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min_rate)
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.window = window
+        self._recent = deque()
+
+    def _trim(self, now):
+        while self._recent and self._recent[0] < now - self.window:
+            self._recent.popleft()
+
+    def record(self, ok, latency):
+
+        """Adjusts the rate from the outcome of a request.
+
+        Args:
+            ok (bool): False when the request was throttled, failed or hit a server error
+            latency (float): The time the request took (in seconds)
+        Returns:
+            None
+        """
+
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            self.requests += 1
+            self._recent.append(now)
+            self._trim(now)
+            if not ok:
+                self.errors += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            elif latency > self.target_latency:
+                self.rate = max(self.min_rate, self.rate * (1 - (1 - self.decrease) / 5.0))
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def requests_per_second(self):
+
+        """Gets the observed request rate.
+
+        Returns:
+            rate (float): Requests per second over the last window.
+        """
+
+        with self._lock:
+            self._trim(time.time())
+            return len(self._recent) / self.window
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'requests_per_second': self.requests_per_second(),
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+        }
+
+
+class Backoff(object):
+
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+
+        """Gets the time to wait before a retry.
+
+        Args:
+            attempt (int): The number of the retry, starting at 0
+            retry_after (float): An optional delay requested by the server
+        Returns:
+            delay (float): The time to wait (in seconds).
+        """
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
@@ -1,10 +1,20 @@
+import os
 import flask
+from customer_recommender.visualize.assets import AssetBundle
+from customer_recommender.visualize.users import get_user_index, parse_query
+
+# Static assets are fingerprinted, they are cached by browsers for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+views = flask.Blueprint('views', __name__)
+
+
+def accepts_gzip():
+    return 'gzip' in flask.request.headers.get('Accept-Encoding', '')
 
-# Initialize the app
-app = flask.Flask(__name__, template_folder='templates', static_folder='static')
 
 # Homepage
-@app.route("/")
+@views.route("/")
 def viz_page():
     """
     Homepage: serve our visualization page, awesome.html
@@ -12,6 +22,84 @@ def viz_page():
 
     return flask.render_template('index.html')
 
-# Start the app server on port 5000
-# (The default website port)
-app.run(host='0.0.0.0', port=5000)
+
+@views.route("/assets/<filename>")
+def asset(filename):
+    """
+    Serves a fingerprinted css or javascript file, compressed when the client accepts gzip
+    """
+
+    found = flask.current_app.config['ASSETS'].get(filename)
+    if found is None:
+        flask.abort(404)
+    gzipped = accepts_gzip() and len(found.gzipped) < len(found.data)
+    response = flask.Response(found.gzipped if gzipped else found.data, mimetype=found.mimetype)
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(ASSET_MAX_AGE)
+    response.set_etag(found.digest)
+    return response.make_conditional(flask.request)
+
+
+@views.route("/api/users")
+def api_users():
+    """
+    Users above min_rating and min_reviews in the clusters given, sorted and paginated,
+    answered from the in-memory index of the artifact
+    """
+
+    index = get_user_index(flask.current_app.config['ARTIFACT_DIR'])
+    try:
+        query = parse_query(flask.request.args)
+    except ValueError as e:
+        response = flask.jsonify(error=str(e))
+        response.status_code = 400
+        return response
+    # the tag only depends on the data and the query, a match skips the query
+    etag = index.etag(query)
+    if etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
+    else:
+        response = flask.jsonify(index.query(**query))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def create_app(artifact_dir=None, preload=False):
+    """Function to create the web app
+
+    Args:
+        artifact_dir (str): The directory of the artifact written by the wrangle step, static/artifact by default
+        preload (bool): Whether to load the user index now instead of on the first query, so that a
+            pre-fork server shares it between its workers
+    Returns:
+        app (flask.Flask): The app
+
+    """
+
+    app = flask.Flask(__name__, template_folder='templates', static_folder='static')
+    # The per-cluster slices written by the wrangle step, loaded by the users endpoint
+    app.config['ARTIFACT_DIR'] = artifact_dir or os.path.join(app.static_folder, 'artifact')
+    app.config['ASSETS'] = AssetBundle.build(app.static_folder)
+    app.register_blueprint(views)
+
+    @app.context_processor
+    def asset_urls():
+        def asset_url(name):
+            return flask.url_for('views.asset', filename=app.config['ASSETS'].url_name(name))
+        return {'asset_url': asset_url}
+
+    if preload:
+        get_user_index(app.config['ARTIFACT_DIR'])
+    return app
+
+
+def main(host='0.0.0.0', port=5000, debug=False):
+    # Start the development server, on port 5000 by default
+    # (The default website port)
+    create_app().run(host=host, port=port, debug=debug)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+The css and javascript files of the page, fingerprinted and compressed once when the app
+is created:
+
+    bundle = AssetBundle.build('customer_recommender/visualize/static')
+    bundle.url_name('datastore.js')     # 'datastore.3f2a9c01b7de.js'
+
+A fingerprinted name changes with the content of the file, so the files are served with
+a cache lifetime of a year and browsers only download them again after a change.
+"""
+
+import os
+import gzip
+import hashlib
+import mimetypes
+from cStringIO import StringIO
+
+EXTENSIONS = ('.css', '.js')
+
+
+class Asset(object):
+
+    """A static file, its content and its gzip compressed content."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.digest = hashlib.sha1(data).hexdigest()
+        root, extension = os.path.splitext(name)
+        self.url_name = '{0}.{1}{2}'.format(root, self.digest[:12], extension)
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        buf = StringIO()
+        # a fixed mtime keeps the compressed bytes identical across workers and restarts
+        compressed = gzip.GzipFile(name, 'wb', 9, buf, mtime=0)
+        compressed.write(data)
+        compressed.close()
+        self.gzipped = buf.getvalue()
+
+
+class AssetBundle(object):
+
+    """The assets of a directory, keyed by their fingerprinted names."""
+
+    def __init__(self, assets):
+        self.assets = dict((asset.url_name, asset) for asset in assets)
+        self.names = dict((asset.name, asset.url_name) for asset in assets)
+
+    @classmethod
+    def build(cls, directory, extensions=EXTENSIONS):
+
+        """Reads and compresses the assets of a directory.
+
+        Args:
+            directory (str): The static directory
+            extensions (tuple): The extensions of the files bundled
+        Returns:
+            bundle (AssetBundle): The bundle of the files.
+        """
+
+        assets = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and name.endswith(extensions):
+                with open(path, 'rb') as infile:
+                    assets.append(Asset(name, infile.read()))
+        return cls(assets)
+
+    def url_name(self, name):
+
+        """Gets the fingerprinted name of an asset.
+
+        Args:
+            name (str): The name of the file in the static directory
+        Returns:
+            url_name (str): The name with the content hash before the extension.
+        Raises:
+            KeyError: The file is not part of the bundle.
+        """
+
+        return self.names[name]
+
+    def get(self, url_name):
+        return self.assets.get(url_name)
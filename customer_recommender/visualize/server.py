@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""
+Serves the web app with gunicorn, a pre-fork WSGI server, for production:
+
+    $ customer-recommender serve --production --workers 4 --threads 8
+    $ gunicorn --preload --workers 4 --threads 8 --bind 0.0.0.0:5000 customer_recommender.visualize.wsgi:app
+
+The app, its user index and its compressed assets are created once in the master process
+before it forks the workers, which share them copy-on-write. Every worker answers
+serve_threads requests concurrently.
+"""
+
+import multiprocessing
+from gunicorn.app.base import BaseApplication
+from customer_recommender.config import settings
+from customer_recommender.visualize.app import create_app
+
+
+def get_options(host='0.0.0.0', port=5000, workers=None, threads=None):
+
+    """Builds the gunicorn settings of the app.
+
+    Args:
+        host (str): The interface to listen on
+        port (int): The port to listen on
+        workers (int): Number of worker processes, serve_workers or 2 per CPU plus 1 by default
+        threads (int): Number of threads per worker, serve_threads or 4 by default
+    Returns:
+        options (dict): The gunicorn settings.
+    """
+
+    return {
+        'bind': '{0}:{1}'.format(host, port),
+        'workers': int(workers or settings.get('serve_workers') or multiprocessing.cpu_count() * 2 + 1),
+        'threads': int(threads or settings.get('serve_threads', 4)),
+        'timeout': int(settings.get('serve_timeout', 30)),
+        'preload_app': True,
+    }
+
+
+class ProductionServer(BaseApplication):
+
+    """Gunicorn application serving an app created before the workers are forked."""
+
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super(ProductionServer, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def main(host='0.0.0.0', port=5000, workers=None, threads=None):
+    options = get_options(host, port, workers, threads)
+    print "Serving on {bind} with {workers} workers of {threads} threads".format(**options)
+    ProductionServer(create_app(preload=True), options).run()
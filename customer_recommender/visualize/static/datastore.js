@@ -1,58 +1,70 @@
 $(document).ready( function () {
-	var _rawData = [];
-	var _sortedData = [];
 	var _filteredData = [];
+	var _total = 0;
+	var _offset = 0;
+	var _limit = 0;
+	var _query = 0;
+	var _timer = null;
 
 	var avgRating = parseFloat($("#rating").text());
 	var numReviews = parseInt($("#review").text());
 	var clusterArray = [];
 
+	// the server filters, sorts and pages the users, see /api/users,
+	// only the page shown is requested, at the default limit of the endpoint
+	function usersUrl(offset) {
+		return "api/users?min_rating=" + avgRating
+			+ "&min_reviews=" + numReviews
+			+ "&clusters=" + clusterArray.join(",")
+			+ "&sort=rating&offset=" + offset;
+	}
+
+	function fetchPage(offset, callback) {
+		var query = ++_query;
+		d3.json(usersUrl(offset), function (error, page) {
+			// a newer query was made while this one was loading
+			if (error || query != _query) {
+				return;
+			}
+			_filteredData = page.users;
+			_total = page.total;
+			_offset = page.offset;
+			_limit = page.limit;
+			callback();
+		});
+	}
+
 	DataStore = window.DataStore = {
-		populateRawData: function (dataElement) {
-			_rawData.push(dataElement);
+		// the filters changed, the first page is loaded once the sliders settle
+		update: function (callback) {
+			clearTimeout(_timer);
+			_timer = setTimeout(function () {
+				fetchPage(0, callback);
+			}, 100);
 		},
 
-
-		sortOnKeys: function () {
-
-		    var sortable = [];
-
-		    for(var i = 0; i < _rawData.length; i++) {
-
-		        sortable.push([_rawData[i], _rawData[i].avg_rating]);
-		    }
-
-			sortable.sort(function (b,a) { 
-				return a[1] - b[1];
-			});
-
-		    var tempData = [];
-
-		    for(var i = 0; i < sortable.length; i++) {
-		        tempData.push(sortable[i][0]);
-		    }
-
-		    _rawData = tempData;
+		nextPage: function (callback) {
+			if (_offset + _limit < _total) {
+				fetchPage(_offset + _limit, callback);
+			}
 		},
 
-		populateFilteredData: function () {
-			_filteredData = [];
-
-			_rawData.forEach(function (data) {
-				if (data.avg_rating >= avgRating
-					&& data.num_reviews >= numReviews 
-					&& clusterArray.indexOf(data.cluster) != -1){
-					_filteredData.push(data);
-				}
-			});
+		previousPage: function (callback) {
+			if (_offset > 0) {
+				fetchPage(Math.max(_offset - _limit, 0), callback);
+			}
 		},
 
 		getFilteredData: function () {
 			return _filteredData;
 		},
 
-		getRawData: function () {
-			return _rawData;
+		getPage: function () {
+			return {
+				offset: _offset,
+				count: _filteredData.length,
+				total: _total
+			}
 		},
 
 		getFilters: function () {
@@ -75,4 +87,4 @@ $(document).ready( function () {
 		}
 
 	};
-});
\ No newline at end of file
+});
@@ -55,6 +55,12 @@ $(document).ready(function() {
             d3.select("#chart").selectAll("svg")
                 .style("height", DataStore.getFilteredData().length * radius / width * radius + 50)
 
+            var page = DataStore.getPage();
+            $("#page_info").text(page.total ? (page.offset + 1) + "-" + (page.offset + page.count) + " of " + page.total
+                                            : "No customers");
+            $("#previous_page").prop("disabled", page.offset == 0);
+            $("#next_page").prop("disabled", page.offset + page.count >= page.total);
+
             $('svg circle').tipsy({
                 gravity: 'w',
                 html: true,
@@ -84,23 +90,28 @@ $(document).ready(function() {
         function filterClusters(e) {
             var cluster = getCheckedCheckboxesFor('cluster');
             DataStore.setClusterArray(cluster);
-            DataStore.populateFilteredData();
-            drawCircles();
+            DataStore.update(drawCircles);
         };
 
         <!-- SET UP EVENT LISTENERS -->
         $("#rating").on("DOMSubtreeModified", function(e) {
             var rating = parseFloat(e.currentTarget.textContent);
             DataStore.setAvgRating(rating);
-            DataStore.populateFilteredData();
-            drawCircles();
+            DataStore.update(drawCircles);
         });
 
         $("#review").on("DOMSubtreeModified", function(e) {
             var review = parseFloat(e.currentTarget.textContent);
             DataStore.setNumReviews(review);
-            DataStore.populateFilteredData();
-            drawCircles();
+            DataStore.update(drawCircles);
+        });
+
+        $("#previous_page").on("click", function() {
+            DataStore.previousPage(drawCircles);
+        });
+
+        $("#next_page").on("click", function() {
+            DataStore.nextPage(drawCircles);
         });
 
         $("#cluster1").on("click", filterClusters);
@@ -165,28 +176,7 @@ $(document).ready(function() {
             .append("g")
             .attr("transform", "translate(" + margin.left + "," + margin.top + ")");
 
-        d3.csv("../static/data.csv", function(error, data) {
-            var x = 0;
-            var y = 0;
-
-
-
-            data.forEach(function(d, i) {
-                d.user = d.user;
-                d.last_review_date = d.last_review_date;
-                d.avg_rating = parseFloat(d.avg_rating);
-                d.num_reviews = parseInt(d.num_reviews);
-                d.cluster = parseInt(d.cluster);
-                d.cluster_name = d.cluster_name;
-                DataStore.populateRawData(d);
-            });
-
-            DataStore.sortOnKeys();
-            DataStore.populateFilteredData();
-
-            drawCircles();
-
-
-        });
+        <!-- LOAD THE FIRST PAGE OF USERS OF THE SELECTED CLUSTERS -->
+        DataStore.update(drawCircles);
 
 });
\ No newline at end of file
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""
+In-memory index of the clustered users, loaded once from the artifact of the wrangle step,
+answering the filter queries of the web page:
+
+    index = UserIndex.load('customer_recommender/visualize/static/artifact')
+    index.query(min_rating=3.5, min_reviews=10, clusters=[1, 4], sort='rating', offset=0, limit=100)
+
+The users of every cluster are kept in two orders, by rating and by number of reviews,
+as numpy arrays. A query finds the users above the minimum of its sort column by binary
+search, filters the other minimum on that prefix and merges the clusters lazily, up to
+the end of the requested page.
+"""
+
+import os
+import json
+import time
+import heapq
+import hashlib
+import itertools
+import threading
+import numpy as np
+
+SORTS = ('rating', 'reviews')
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class ClusterUsers(object):
+
+    """The users of a cluster, sorted by rating and by number of reviews."""
+
+    def __init__(self, cluster, cluster_name, users, ratings, reviews, dates):
+        self.cluster = cluster
+        self.cluster_name = cluster_name
+        # fixed width arrays, so that forked workers share them without touching their pages
+        self.users = np.array(users, dtype=str)
+        self.ratings = np.array(ratings, dtype=float)
+        self.reviews = np.array(reviews, dtype=np.int64)
+        self.dates = np.array(dates, dtype=str)
+        position = np.arange(len(self.users))
+        # ties keep the order of the artifact
+        self.orders = {
+            'rating': np.lexsort((position, -self.reviews, -self.ratings)),
+            'reviews': np.lexsort((position, -self.ratings, -self.reviews)),
+        }
+        # the sort column in each order, negated so that it is ascending for searchsorted
+        self.keys = {
+            'rating': -self.ratings[self.orders['rating']],
+            'reviews': -self.reviews[self.orders['reviews']],
+        }
+
+    def __len__(self):
+        return len(self.users)
+
+    def select(self, min_rating=0, min_reviews=0, sort='rating'):
+
+        """Finds the users of the cluster above both minimums.
+
+        Args:
+            min_rating (float): Minimum average rating
+            min_reviews (int): Minimum number of reviews
+            sort (str): 'rating' or 'reviews', the order of the rows
+        Returns:
+            rows (numpy.ndarray): The positions of the users, in the sort order.
+        """
+
+        if sort == 'rating':
+            end = np.searchsorted(self.keys['rating'], -min_rating, side='right')
+            rows = self.orders['rating'][:end]
+            return rows[self.reviews[rows] >= min_reviews]
+        end = np.searchsorted(self.keys['reviews'], -min_reviews, side='right')
+        rows = self.orders['reviews'][:end]
+        return rows[self.ratings[rows] >= min_rating]
+
+    def keyed(self, rows, sort):
+        # merge keys of the rows, unique so that the merge never compares clusters
+        ratings, reviews = self.ratings[rows].tolist(), self.reviews[rows].tolist()
+        if sort == 'rating':
+            keys = itertools.izip([-r for r in ratings], [-n for n in reviews])
+        else:
+            keys = itertools.izip([-n for n in reviews], [-r for r in ratings])
+        for rank, (key, row) in enumerate(itertools.izip(keys, rows.tolist())):
+            yield key + (self.cluster, rank), self, row
+
+    def row(self, i, prefix=''):
+        return {
+            'user': prefix + self.users[i],
+            'avg_rating': float(self.ratings[i]),
+            'num_reviews': int(self.reviews[i]),
+            'last_review_date': self.dates[i],
+            'cluster': self.cluster,
+            'cluster_name': self.cluster_name,
+        }
+
+
+class UserIndex(object):
+
+    """The clustered users of an artifact, indexed for filter queries."""
+
+    def __init__(self, clusters, user_prefix='', version=None):
+        self.clusters = sorted(clusters, key=lambda cluster: cluster.cluster)
+        self.user_prefix = user_prefix
+        self.version = version or ''
+        self.directory = None
+        self.mtime = None
+
+    @classmethod
+    def load(cls, directory):
+
+        """Loads the artifact written by wrangle.artifact.write_artifact.
+
+        Args:
+            directory (str): The directory of the artifact
+        Returns:
+            index (UserIndex): The index of its users, its version is a hash of the artifact files.
+        Raises:
+            IOError: The artifact is missing or was rewritten while it was read.
+        """
+
+        path = os.path.join(directory, 'index.json')
+        mtime = os.path.getmtime(path)
+        digest = hashlib.sha1()
+        with open(path, 'rb') as infile:
+            data = infile.read()
+        digest.update(data)
+        artifact = json.loads(data)
+        clusters = []
+        for info in artifact['clusters']:
+            with open(os.path.join(directory, info['file']), 'rb') as infile:
+                data = infile.read()
+            digest.update(data)
+            columns = json.loads(data)
+            if len(columns['user']) != info['count']:
+                raise IOError('{0} does not match {1}'.format(info['file'], path))
+            clusters.append(ClusterUsers(info['cluster'], columns['cluster_name'], columns['user'],
+                                         columns['avg_rating'], columns['num_reviews'], columns['last_review_date']))
+        # the index is written last, a new one means the slices read may be mixed
+        if os.path.getmtime(path) != mtime:
+            raise IOError('{0} was rewritten while it was read'.format(directory))
+        index = cls(clusters, artifact.get('user_prefix', ''), digest.hexdigest())
+        index.directory = directory
+        index.mtime = mtime
+        return index
+
+    def __len__(self):
+        return sum(len(cluster) for cluster in self.clusters)
+
+    def etag(self, query):
+        """Function to compute the entity tag of the response to a query, from the version and the query"""
+
+        return hashlib.sha1(self.version + json.dumps(query, sort_keys=True)).hexdigest()
+
+    def query(self, min_rating=0, min_reviews=0, clusters=None, sort='rating', offset=0, limit=DEFAULT_LIMIT):
+
+        """Finds a page of the users above the minimums.
+
+        Args:
+            min_rating (float): Minimum average rating
+            min_reviews (int): Minimum number of reviews
+            clusters (list): The clusters searched, every cluster when None
+            sort (str): 'rating' (then number of reviews) or 'reviews' (then rating), both decreasing
+            offset (int): Number of users skipped
+            limit (int): Maximum number of users returned
+        Returns:
+            page (dict): The total number of users found, the offset and limit, and the users of the page.
+        """
+
+        if sort not in SORTS:
+            raise ValueError("Unknown sort '{0}', expected one of {1}".format(sort, ', '.join(SORTS)))
+        wanted = None if clusters is None else set(clusters)
+        total, streams = 0, []
+        for cluster in self.clusters:
+            if wanted is not None and cluster.cluster not in wanted:
+                continue
+            rows = cluster.select(min_rating, min_reviews, sort)
+            total += len(rows)
+            # no cluster contributes more rows than the end of the page
+            if len(rows):
+                streams.append(cluster.keyed(rows[:offset + limit], sort))
+        page = itertools.islice(heapq.merge(*streams), offset, offset + limit)
+        return {
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'users': [cluster.row(row, self.user_prefix) for key, cluster, row in page],
+        }
+
+
+def parse_query(args):
+
+    """Reads the query of the users endpoint from request arguments.
+
+    Args:
+        args (dict): The arguments, min_rating, min_reviews, clusters (comma separated, empty for none),
+            sort, offset and limit, all optional
+    Returns:
+        query (dict): The keyword arguments of UserIndex.query.
+    Raises:
+        ValueError: An argument is malformed or out of range.
+    """
+
+    query = {
+        'min_rating': float(args.get('min_rating', 0)),
+        'min_reviews': int(args.get('min_reviews', 0)),
+        'clusters': None,
+        'sort': args.get('sort', 'rating'),
+        'offset': int(args.get('offset', 0)),
+        'limit': int(args.get('limit', DEFAULT_LIMIT)),
+    }
+    if args.get('clusters') is not None:
+        query['clusters'] = sorted(set(int(cluster) for cluster in args['clusters'].split(',') if cluster.strip()))
+    if query['sort'] not in SORTS:
+        raise ValueError("sort must be one of {0}".format(', '.join(SORTS)))
+    if query['offset'] < 0 or not 0 < query['limit'] <= MAX_LIMIT:
+        raise ValueError("offset must be positive and limit between 1 and {0}".format(MAX_LIMIT))
+    return query
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_user_index(directory):
+
+    """Returns the index of the artifact in a directory, loaded once and reloaded when the artifact is rewritten.
+
+    Args:
+        directory (str): The directory of the artifact
+    Returns:
+        index (UserIndex): The shared index.
+    """
+
+    global _INDEX
+    mtime = os.path.getmtime(os.path.join(directory, 'index.json'))
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX.directory != directory or _INDEX.mtime != mtime:
+            for attempt in range(3):
+                try:
+                    _INDEX = UserIndex.load(directory)
+                    break
+                except IOError:
+                    # the wrangle step is rewriting the artifact
+                    if attempt == 2:
+                        raise
+                    time.sleep(0.1)
+        return _INDEX
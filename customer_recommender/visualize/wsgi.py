@@ -0,0 +1,9 @@
+"""
+WSGI entry point of the web app, for servers that import it, with the user index loaded at import:
+
+    $ gunicorn --preload --workers 4 --threads 8 customer_recommender.visualize.wsgi:app
+"""
+
+from customer_recommender.visualize.app import create_app
+
+app = create_app(preload=True)
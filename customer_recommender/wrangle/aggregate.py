@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Server-side aggregations over the one-document-per-review collection.
+"""
+
+import pandas as pd
+
+
+def user_summary_pipeline(min_reviews=5):
+    """Function to build the aggregation pipeline summarizing each user.
+
+    The pipeline mirrors the pandas groupby of clean_df: reviews are counted when they
+    have a text, ratings are averaged and the last review date is kept.
+
+    Args:
+        min_reviews (int): The minimum number of reviews a user must have to be considered a top_user
+    Returns:
+        pipeline (list): The aggregation pipeline
+
+    """
+    return [
+        {'$match': {'user': {'$ne': None}}},
+        {'$group': {
+            '_id': '$user',
+            'review': {'$sum': {'$cond': [{'$ifNull': ['$review', False]}, 1, 0]}},
+            'rating': {'$avg': '$rating'},
+            'date': {'$max': '$date'},
+        }},
+        {'$match': {'review': {'$gt': min_reviews}}},
+        {'$sort': {'review': -1}},
+    ]
+
+
+def get_user_summaries(collection, min_reviews=5):
+    """Function to get the review count, mean rating and last review date of the top users.
+
+    Args:
+        collection (pymongo.collection.Collection): The review collection
+        min_reviews (int): The minimum number of reviews a user must have to be considered a top_user
+    Returns:
+        df (pandas.DataFrame): DataFrame indexed by user with the review, rating and date columns
+
+    """
+    rows = list(collection.aggregate(user_summary_pipeline(min_reviews), allowDiskUse=True))
+    df = pd.DataFrame(rows, columns=['_id', 'review', 'rating', 'date']).set_index('_id')
+    df.index.name = 'user'
+    return df
+
+
+def get_top_users(collection, min_reviews=5):
+    """Function to get the top users with a server-side aggregation.
+
+    Args:
+        collection (pymongo.collection.Collection): The review collection
+        min_reviews (int): The minimum number of reviews a user must have to be considered a top_user
+    Returns:
+        top_users (list): A list of the top local Yelp reviewers
+
+    """
+    return get_user_summaries(collection, min_reviews).index.tolist()
+
+
+def get_user_reviews(collection, users):
+    """Function to get the reviews written by a set of users.
+
+    Args:
+        collection (pymongo.collection.Collection): The review collection
+        users (list): List of users
+    Returns:
+        df (pandas.DataFrame): Reviews with the user, review, date, rating and restaurant columns
+
+    """
+    columns = ['user', 'review', 'date', 'rating', 'restaurant']
+    projection = dict((column, 1) for column in columns)
+    projection['_id'] = 0
+    cursor = collection.find({'user': {'$in': list(users)}}, projection).sort([('restaurant', 1), ('position', 1)])
+    return pd.DataFrame(list(cursor), columns=columns)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""
+Writes the cluster data as the artifact the users endpoint of the web app loads,
+instead of a flat csv:
+
+    index.json             the clusters, with their name, row offset and count, the file of
+                           their rows and summary stats of their columns
+    cluster-<n>.json       the rows of cluster n, one array per column, in display order
+
+The rows come in the order of clean_df, by cluster then by decreasing rating and number
+of reviews. The page queries the endpoint for the users it shows, the files are only read
+by visualize.users.UserIndex.
+"""
+
+import os
+import json
+import glob
+import numpy as np
+from customer_recommender.helper import create_dir
+
+ARTIFACT_VERSION = 2
+
+# the columns of a cluster slice, cluster and cluster_name are stored once per slice
+COLUMNS = ['user', 'avg_rating', 'num_reviews', 'last_review_date']
+
+
+def _write(path, data):
+    # the file is renamed into place once complete
+    payload = json.dumps(data, separators=(',', ':'), sort_keys=True)
+    with open(path + '.tmp', 'wb') as outfile:
+        outfile.write(payload)
+    os.rename(path + '.tmp', path)
+    return len(payload)
+
+
+def _stats(values):
+    return {'min': values.min().item(), 'max': values.max().item(), 'mean': round(values.mean().item(), 2)}
+
+
+def write_artifact(df, directory):
+
+    """Writes the cluster data as per-cluster slices and their index.
+
+    Args:
+        df (pandas.DataFrame): The cluster data, as returned by clean_df
+        directory (str): The directory of the artifact, slices of clusters that no longer exist are removed
+    Returns:
+        index (dict): The index written to index.json.
+    """
+
+    create_dir(directory)
+    # the users share the profile url, only their ids are stored
+    prefix = os.path.commonprefix(df['user'].astype(str).tolist()) if len(df) > 1 else ''
+    index = {'version': ARTIFACT_VERSION, 'rows': len(df), 'columns': COLUMNS, 'user_prefix': prefix,
+             'clusters': []}
+
+    offset = 0
+    files = set()
+    # groupby keeps the order of the rows within every cluster
+    for cluster, group in df.groupby('cluster', sort=True):
+        name = 'cluster-{0}.json'.format(cluster)
+        data = {
+            'cluster': int(cluster),
+            'cluster_name': group['cluster_name'].iloc[0],
+            'user': group['user'].astype(str).str[len(prefix):].tolist(),
+            'avg_rating': group['avg_rating'].astype(float).tolist(),
+            'num_reviews': group['num_reviews'].astype(int).tolist(),
+            'last_review_date': group['last_review_date'].astype(str).tolist(),
+        }
+        size = _write(os.path.join(directory, name), data)
+        files.add(name)
+        index['clusters'].append({
+            'cluster': int(cluster),
+            'cluster_name': data['cluster_name'],
+            'offset': offset,
+            'count': len(group),
+            'file': name,
+            'bytes': size,
+            'stats': {
+                'avg_rating': _stats(group['avg_rating'].values.astype(float)),
+                'num_reviews': _stats(group['num_reviews'].values.astype(np.int64)),
+                'last_review_date': {'min': min(data['last_review_date']), 'max': max(data['last_review_date'])},
+            },
+        })
+        offset += len(group)
+
+    # the index is written last, it only lists complete slices
+    _write(os.path.join(directory, 'index.json'), index)
+    # the gzip copies written by version 1 are removed too
+    for path in glob.glob(os.path.join(directory, 'cluster-*.json*')) + glob.glob(os.path.join(directory, '*.gz')):
+        if os.path.basename(path) not in files and os.path.exists(path):
+            os.remove(path)
+    return index
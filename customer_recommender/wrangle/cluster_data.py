@@ -1,38 +1,78 @@
 #!/usr/bin/env python
-from pymongo import MongoClient
-
+import numpy as np
 import pandas as pd
-import nltk
-import re
 import os
 import random
 
-from nltk.stem.snowball import SnowballStemmer
-from nltk.tokenize import wordpunct_tokenize
 from nltk.corpus import stopwords
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+from customer_recommender import metrics
+from customer_recommender.config import settings
+from customer_recommender.helper import get_database
+from customer_recommender.ingest.store import LocalStore
+from customer_recommender.wrangle.aggregate import get_user_summaries, get_user_reviews
+from customer_recommender.wrangle.artifact import write_artifact
+from customer_recommender.wrangle.clustering import fit_clusters
+from customer_recommender.wrangle.features import FEATURES, HashingFeatures, term_centers
+from customer_recommender.wrangle.model import ClusterModel, load_model, patch_csv
+from customer_recommender.wrangle.tokens import STEMMER, StemIndex, TokenCache, corpora_key, tokenize, \
+    tokenize_corpora, identity
+
+# the review fields used by the wrangle step, and the columns of the raw dataframe
+REVIEW_FIELDS = ['user', 'review', 'date', 'rating']
+RAW_COLUMNS = REVIEW_FIELDS + ['restaurant']
+
+
+def summarize_users(df):
+    """Function to aggregate the reviews of every user in a single grouped pass.
 
-DB = MongoClient().yelpdb
-COLLECTION = DB.review_collection
+    Args:
+        df (pandas.DataFrame): The dataframe containing all the reviews, ratings, dates, restaurant, and users
+    Returns:
+        summary (pandas.DataFrame): DataFrame indexed by user, sorted by decreasing number of reviews, with
+            the joined review corpus (reviews), review count (review), mean rating (rating) and last date (date)
 
+    """
 
-def get_top_users(df, min_reviews=5):
+    # group on integer codes, categorical users would otherwise produce a group per category
+    if str(df['user'].dtype) == 'category':
+        codes, labels = df['user'].cat.codes.values, df['user'].cat.categories
+    else:
+        codes, labels = pd.factorize(df['user'])
+    frame = pd.DataFrame({'code': codes,
+                          'review': df['review'].values,
+                          'reviews': df['review'].fillna('').values,
+                          'rating': df['rating'].values,
+                          'date': df['date'].values})
+    frame = frame[frame['code'] >= 0]
+
+    summary = frame.groupby('code', sort=False).agg({'review': 'count',
+                                                     'reviews': ''.join,
+                                                     'rating': 'mean',
+                                                     'date': 'max'})
+    summary.index = pd.Index(np.asarray(labels)[summary.index.values], name='user')
+    summary = summary[['reviews', 'review', 'rating', 'date']].sort_index()
+    return summary.sort_values(by='review', ascending=False, kind='mergesort')
+
+
+def get_top_users(df, min_reviews=5, summary=None):
     """Function to get the top users from the cleaned dataframe.
 
     Args:
         df (pandas.DataFrame): The dataframe containing all the reviews, ratings, dates, restaurant, and users
         min_reviews (int): The minimum number of reviews a user must have to be considered a top_user
+        summary (pandas.DataFrame): Optional output of summarize_users(df)
     Returns:
         top_users (list): A list of the top local Yelp reviewers
 
     """
-    top_users_df = df.groupby('user').agg({'review': 'count'}).sort_values(by='review', ascending=False)
-    top_users = top_users_df[top_users_df['review'] > min_reviews].index.tolist()
+    if summary is None:
+        summary = summarize_users(df)
+    top_users = summary[summary['review'] > min_reviews].index.tolist()
     return top_users
 
 
-def tokenize_and_stem(text, stemmer=SnowballStemmer("english")):
+def tokenize_and_stem(text, stemmer=STEMMER):
     """Word and sentence tokenization function that utilizes the Snowball Stemmer
 
     Args:
@@ -42,15 +82,7 @@ def tokenize_and_stem(text, stemmer=SnowballStemmer("english")):
         stems (list): The filtered and stemmed tokens
 
     """
-    # first tokenize by sentence, then by word to ensure that punctuation is caught as it's own token
-    tokens = [word for sent in nltk.sent_tokenize(text) for word in wordpunct_tokenize(sent)]
-    filtered_tokens = []
-    # filter out any tokens not containing letters (e.g., numeric tokens, raw punctuation)
-    for token in tokens:
-        if re.search('[a-zA-Z]', token):
-            filtered_tokens.append(token)
-    stems = [stemmer.stem(t) for t in filtered_tokens]
-    return stems
+    return tokenize(text, stemmer)[1]
 
 
 def tokenize_only(text):
@@ -62,105 +94,174 @@ def tokenize_only(text):
         filtered_tokens (list): The filtered tokens
 
     """
-    # first tokenize by sentence, then by word to ensure that punctuation is caught as it's own token
-    tokens = [word.lower() for sent in nltk.sent_tokenize(text) for word in wordpunct_tokenize(sent)]
-    filtered_tokens = []
-    # filter out any tokens not containing letters (e.g., numeric tokens, raw punctuation)
-    for token in tokens:
-        if re.search('[a-zA-Z]', token):
-            filtered_tokens.append(token)
-    return filtered_tokens
+    return tokenize(text)[0]
 
 
-def get_raw_dataframe(collection):
-    """Function to get raw data from MongoDB collection
+def count_reviews(collection, query=None):
+    """Function to count the reviews embedded in the business documents of a collection
 
     Args:
-        collection (string): MongoDB collection
+        collection (pymongo.collection.Collection): MongoDB collection
+        query (dict): Optional filter on the business documents
     Returns:
-        df (pandas.DataFrame): Raw dataframe data
+        n_reviews (int): Number of reviews
 
     """
 
-    df = pd.DataFrame()
-    cursor = collection.find()
-    for i in cursor:
-        new_df = pd.DataFrame(i['reviews'])
-        new_df['restaurant'] = i['id']
-        df = df.append(new_df)
+    pipeline = [{'$match': query or {}},
+                {'$group': {'_id': None, 'n': {'$sum': {'$size': {'$ifNull': ['$reviews', []]}}}}}]
+    result = list(collection.aggregate(pipeline))
+    return result[0]['n'] if result else 0
+
+
+def _build_raw_dataframe(columns, n, categorical=True):
+    """Function to build a raw dataframe from filled column buffers"""
+
+    df = pd.DataFrame(dict((name, values[:n]) for name, values in columns.items()), columns=RAW_COLUMNS)
+    if categorical:
+        df['user'] = df['user'].astype('category')
+        df['restaurant'] = df['restaurant'].astype('category')
     return df
 
 
-def create_user_df(df):
-    """Function to create a DataFrame grouped by user. The review column contains all the reviews for a specific
-       user as a string.
+def _new_buffers(size):
+    """Function to preallocate the column buffers of a raw dataframe"""
+
+    columns = dict((name, np.empty(size, dtype=object)) for name in RAW_COLUMNS)
+    columns['rating'] = np.empty(size, dtype=float)
+    columns['rating'].fill(np.nan)
+    return columns
+
+
+def _iter_reviews(collection, batch_size):
+    """Function to stream (restaurant, review) pairs with only the fields the wrangle step uses"""
+
+    projection = dict(('reviews.{0}'.format(field), 1) for field in REVIEW_FIELDS)
+    projection.update({'id': 1, '_id': 0})
+    for business in collection.find({}, projection).batch_size(batch_size):
+        for review in business.get('reviews', []):
+            yield business['id'], review
+
+
+def get_raw_dataframe(collection, batch_size=500, categorical=True):
+    """Function to get raw data from MongoDB collection
+
+    Only the review fields are fetched, streamed in cursor batches into preallocated
+    column buffers, and the dataframe is built once.
 
     Args:
         collection (string): MongoDB collection
+        batch_size (int): Number of business documents fetched per cursor batch
+        categorical (bool): Whether the user and restaurant columns are categorical
     Returns:
-        df (pandas.DataFrame): DataFrame with users and reviews
+        df (pandas.DataFrame): Raw dataframe data
 
     """
 
-    user_review_list = []
-    for user in get_top_users(df):
-        d = {}
-        reviews = ''
-        df2 = df[df['user'] == user]
-        for review in df2['review'].tolist():
-            reviews += review
-        d['user'] = user
-        d['reviews'] = reviews
-        user_review_list.append(d)
-    return pd.DataFrame(user_review_list)
+    size = count_reviews(collection)
+    columns = _new_buffers(size)
+    n = 0
+    for restaurant, review in _iter_reviews(collection, batch_size):
+        if n == size:
+            # reviews were added since they were counted
+            size = max(2 * size, 1)
+            grown = _new_buffers(size)
+            for name, values in columns.items():
+                grown[name][:n] = values
+            columns = grown
+        for field in REVIEW_FIELDS:
+            if field in review:
+                columns[field][n] = review[field]
+        columns['restaurant'][n] = restaurant
+        n += 1
+    return _build_raw_dataframe(columns, n, categorical)
+
+
+def iter_raw_dataframes(collection, chunksize=100000, batch_size=500, categorical=True):
+    """Function to get raw data from MongoDB collection in chunks of bounded size
 
+    Args:
+        collection (string): MongoDB collection
+        chunksize (int): Maximum number of reviews in a chunk
+        batch_size (int): Number of business documents fetched per cursor batch
+        categorical (bool): Whether the user and restaurant columns are categorical
+    Returns:
+        chunks (generator): Raw dataframes of at most chunksize reviews
 
-def get_stop_words(stop):
-    """Function to append a custom list of stop words to the nltk.stopwords.
+    """
+
+    columns = _new_buffers(chunksize)
+    n = 0
+    for restaurant, review in _iter_reviews(collection, batch_size):
+        for field in REVIEW_FIELDS:
+            if field in review:
+                columns[field][n] = review[field]
+        columns['restaurant'][n] = restaurant
+        n += 1
+        if n == chunksize:
+            yield _build_raw_dataframe(columns, n, categorical)
+            columns = _new_buffers(chunksize)
+            n = 0
+    if n:
+        yield _build_raw_dataframe(columns, n, categorical)
+
+
+def get_local_dataframe(store):
+    """Function to get raw data from the local crawl store with a single query
 
     Args:
-        stop (list): List of stopwords
+        store (LocalStore): Local store of the crawled businesses
     Returns:
-        stop (list): List of stopwords
+        df (pandas.DataFrame): Raw dataframe data
 
     """
-    stop.extend(["don't", "don", "didn't", "should've", "could've", "would've", "m", "got", "get", "came", "pretty", "ve"])
-    return stop
+
+    return pd.DataFrame.from_records(store.iter_reviews(), columns=['user', 'review', 'date', 'rating', 'restaurant'])
 
 
-def build_vocab_frame(reviews, stop):
-    """Function to build a vocabulary frame with stemmed words and original words
+def create_user_df(df, summary=None, min_reviews=5):
+    """Function to create a DataFrame grouped by user. The review column contains all the reviews for a specific
+       user as a string.
 
     Args:
-        reviews (list): List of reviews
-        stop (list): List of stopwords
+        df (pandas.DataFrame): The dataframe containing all the reviews, ratings, dates, restaurant, and users
+        summary (pandas.DataFrame): Optional output of summarize_users(df)
+        min_reviews (int): The minimum number of reviews a user must have to be considered a top_user
     Returns:
-        vocab_frame (pandas.DataFrame): Data frame with stemmed words and original words
+        df (pandas.DataFrame): DataFrame with users and reviews
 
     """
 
-    totalvocab_stemmed = []
-    totalvocab_tokenized = []
+    if summary is None:
+        summary = summarize_users(df)
+    top_users = summary[summary['review'] > min_reviews]
+    return pd.DataFrame({'reviews': top_users['reviews'].values, 'user': top_users.index.values},
+                        columns=['reviews', 'user'])
 
-    for review_corpus in reviews:
-        allwords_stemmed = tokenize_and_stem(review_corpus)
-        totalvocab_stemmed.extend(allwords_stemmed)
 
-        allwords_tokenized = tokenize_only(review_corpus)
-        totalvocab_tokenized.extend(allwords_tokenized)
-        vocab_frame = pd.DataFrame({'words': totalvocab_tokenized}, index=totalvocab_stemmed)
-    return vocab_frame
+def get_stop_words(stop):
+    """Function to append a custom list of stop words to the nltk.stopwords.
+
+    Args:
+        stop (list): List of stopwords
+    Returns:
+        stop (list): List of stopwords
+
+    """
+    stop.extend(["don't", "don", "didn't", "should've", "could've", "would've", "m", "got", "get", "came", "pretty", "ve"])
+    return stop
 
 
-def get_cluster_words_dict(reviews, vocab_frame, km, num_clusters, terms):
+def get_cluster_words_dict(reviews, stem_index, km, num_clusters, terms, centers=None):
     """Function to obtain the top words for each cluster.
 
     Args:
         reviews (list): List of reviews
-        vocab_frame (pandas.DataFrame): Data frame with stemmed words and original words
+        stem_index (StemIndex): Index of the most frequent word of each stem
         km (KMeans): K means model
         num_clusters: Number of clusters
         terms (list): List of words found in clusters
+        centers (numpy.ndarray): Optional cluster centers with a column per term, km.cluster_centers_ when not given
     Returns:
         cluster_words_dict (dict): A dictionary of cluster number and closest cluster words
 
@@ -168,14 +269,15 @@ def get_cluster_words_dict(reviews, vocab_frame, km, num_clusters, terms):
 
     clusters = km.labels_.tolist()
     # sort cluster centers by proximity to centroid
-    order_centroids = km.cluster_centers_.argsort()[:, ::-1]
+    if centers is None:
+        centers = km.cluster_centers_
+    order_centroids = centers.argsort()[:, ::-1]
 
     cluster_words_dict = {}
     for i in range(num_clusters):
-        word_list = []
-        num_words = 5
-        cluster_words_dict[i] = ' '.join([vocab_frame.ix[terms[ind].split(' ')].values.tolist()[0][0].encode('utf-8', 'ignore') \
-                                          for ind in order_centroids[i, :5]])
+        # n-grams are labelled with the word of their first stem, or the stem itself when it is not indexed
+        stems = [terms[ind].split(' ')[0] for ind in order_centroids[i, :5]]
+        cluster_words_dict[i] = ' '.join([stem_index.word(stem, stem).encode('utf-8', 'ignore') for stem in stems])
     return cluster_words_dict
 
 
@@ -205,7 +307,30 @@ def manually_define_clusters():
     return cluster_words_dict
 
 
-def clean_df(df, cluster_words_dict, km, users):
+def round_like_builtin(values, digits=2):
+    """Function to round an array as round(x, digits) rounds each of its floats
+
+    round() rounds the exact binary value of a float, so 1.075 (stored as 1.07499...) gives 1.07.
+    The scaled values are rounded half up, except the ones close to a half, where the inexact
+    product cannot tell the side and round() decides.
+
+    Args:
+        values (numpy.ndarray): The floats to round
+        digits (int): Number of decimals
+    Returns:
+        rounded (numpy.ndarray): The rounded floats, equal to round(x, digits) for every x
+
+    """
+
+    scale = 10 ** digits
+    scaled = values * scale
+    rounded = np.floor(scaled + 0.5) / scale
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[near_half] = [round(x, digits) for x in values[near_half]]
+    return rounded
+
+
+def clean_df(df, cluster_words_dict, km, users, user_summary=None, labels=None):
     """Function to create final cleaned dataframe for analysis.
 
     Args:
@@ -213,69 +338,242 @@ def clean_df(df, cluster_words_dict, km, users):
         cluster_words_dict (dict): A dictionary of cluster number and closest cluster words
         km (KMeans): K means model
         users (list): List of users
+        user_summary (pandas.DataFrame): Optional per user review count, mean rating and last date,
+            from summarize_users or aggregate.get_user_summaries, computed from df when not given
+        labels (list): Optional cluster of each user, km.labels_ when not given
     Returns:
         cluster_words_dict (dict): A dictionary of cluster number and closest cluster words
 
     """
 
-    filtered_df = df.groupby('user').agg({'rating': 'mean', 'review': 'count', 'date': 'max'}).sort_values(by='review', ascending=False)
+    if user_summary is None:
+        user_summary = summarize_users(df)
+    filtered_df = user_summary[['date', 'rating', 'review']]
     filtered_df = filtered_df[filtered_df['review'] > 5]
-    final_df = filtered_df.join(pd.DataFrame(km.labels_.tolist(), index=[users], columns=['cluster']), how='inner')
+    if labels is None:
+        labels = km.labels_
+    final_df = filtered_df.join(pd.DataFrame(list(labels), index=pd.Index(users, name='user'), columns=['cluster']), how='inner')
     final_df = final_df.sort_values(by=['cluster', 'rating', 'review'], ascending=[True, False, False])
     final_df.reset_index(inplace=True)
     final_df.rename(columns={'review': 'num_reviews'}, inplace=True)
     final_df.rename(columns={'rating': 'avg_rating'}, inplace=True)
     final_df.rename(columns={'date': 'last_review_date'}, inplace=True)
     final_df.rename(columns={'index': 'user'}, inplace=True)
-    final_df['cluster_name'] = final_df['cluster'].apply(lambda x: cluster_words_dict[x])
-    final_df['cluster'] = final_df['cluster'].apply(lambda x: x + 1)
-    final_df['avg_rating'] = final_df['avg_rating'].apply(lambda x: round(float(x), 2))
-    final_df['user'] = final_df['user'].apply(lambda x: 'www.yelp.com' + x)
+    # column-wise transforms instead of a Python call per row
+    final_df['cluster_name'] = final_df['cluster'].map(cluster_words_dict)
+    final_df['cluster'] = final_df['cluster'] + 1
+    final_df['avg_rating'] = round_like_builtin(final_df['avg_rating'].astype(float).values, 2)
+    final_df['user'] = 'www.yelp.com' + final_df['user'].astype(object)
     return final_df
 
 
-def main():
+def load_reviews():
+    """Function to load the reviews from the configured review source
 
-    random.seed(2)
-    print "Starting task to cluster data..."
-    stop = get_stop_words(stopwords.words('english'))
-    df = get_raw_dataframe(COLLECTION)
-    user_df = create_user_df(df)
+    Args:
+        None
+    Returns:
+        df (pandas.DataFrame): Raw dataframe data
+        user_summary (pandas.DataFrame): Per user statistics aggregated by the server, or None
 
-    # get list of users and reviews
-    users = user_df['user'].tolist()
-    reviews = user_df['reviews'].tolist()
+    """
+
+    user_summary = None
+    review_source = settings.get('review_source', 'mongodb')
+    if review_source == 'local':
+        df = get_local_dataframe(LocalStore(settings.get('store_path', os.path.join('output', 'crawl.db'))))
+    elif review_source == 'reviews':
+        # summarize users on the server and only pull the reviews of the top users
+        reviews = get_database()[settings.get('reviews_collection', 'reviews')]
+        user_summary = get_user_summaries(reviews)
+        df = get_user_reviews(reviews, user_summary.index.tolist())
+    else:
+        df = get_raw_dataframe(get_database()[settings.get('collection', 'review_collection')])
+    return df, user_summary
+
+
+def build_tfidf_matrix(tokenized, stop):
+    """Function to build the tf-idf matrix of the tokenized user corpora
+
+    Args:
+        tokenized (list): (tokens, stems) of each user corpus
+        stop (list): List of stopwords
+    Returns:
+        tfidf_vectorizer (TfidfVectorizer): The fitted vectorizer
+        tfidf_matrix (scipy.sparse.csr_matrix): The tf-idf matrix with a row per user
+
+    """
 
-    # tfidf
-    vocab_frame = build_vocab_frame(reviews, stop)
     tfidf_vectorizer = TfidfVectorizer(max_df=0.8,
                                        max_features=200000,
                                        min_df=0.2,
-                                       lowercase=True,
+                                       lowercase=False,
+                                       preprocessor=identity,
                                        stop_words=stop,
                                        use_idf=True,
-                                       tokenizer=tokenize_and_stem,
+                                       tokenizer=identity,
                                        ngram_range=(1, 3))
-    tfidf_matrix = tfidf_vectorizer.fit_transform(reviews)
-    terms = tfidf_vectorizer.get_feature_names()
+    tfidf_matrix = tfidf_vectorizer.fit_transform([stems for tokens, stems in tokenized])
+    return tfidf_vectorizer, tfidf_matrix
+
+
+def build_features(tokenized, stop, features='tfidf'):
+    """Function to build the feature matrix of the tokenized user corpora
 
-    num_clusters = 10
+    Args:
+        tokenized (list): (tokens, stems) of each user corpus
+        stop (list): List of stopwords
+        features (str): 'tfidf' (TfidfVectorizer) or 'hashing' (HashingFeatures, bounded memory)
+    Returns:
+        vectorizer (TfidfVectorizer or HashingFeatures): The fitted vectorizer
+        matrix (scipy.sparse.csr_matrix): The feature matrix with a row per user
 
-    print "Performing k-means..."
+    """
+
+    if features not in FEATURES:
+        raise ValueError("Unknown feature path '{0}', expected one of {1}".format(features, ', '.join(FEATURES)))
+    if features == 'tfidf':
+        return build_tfidf_matrix(tokenized, stop)
+    vectorizer = HashingFeatures(stop_words=stop,
+                                 n_features=int(settings.get('hash_features', 2 ** 20)),
+                                 svd_components=int(settings.get('svd_components', 0)))
+    matrix = vectorizer.fit_transform([stems for tokens, stems in tokenized])
+    return vectorizer, matrix
+
+
+def assign_changed_users(model, df, users, reviews, user_summary, outfile, artifact_dir):
+    """Function to assign the new and changed users to the clusters of a saved model and patch the output
+
+    Args:
+        model (ClusterModel): The saved model
+        df (pandas.DataFrame): Raw dataframe data
+        users (list): List of users
+        reviews (list): The corpus of each user
+        user_summary (pandas.DataFrame): Per user review count, mean rating and last date
+        outfile (str): The path of data.csv
+        artifact_dir (str): The directory of the artifact of the web page, rewritten from the patched data
+    Returns:
+        patched (bool): False when the drift is above refit_drift and the model must be refitted
+
+    """
+
+    changed = model.changed_users(users, reviews)
+    changed_users = [users[i] for i in changed]
+    changed_reviews = [reviews[i] for i in changed]
+    tokenized = tokenize_corpora(changed_reviews, workers=int(settings.get('tokenize_workers', 1)))
+    labels, distances = model.assign([stems for tokens, stems in tokenized])
+    drift = model.drift(distances)
+    print "{0} of {1} users changed, drift {2:.3f}".format(len(changed), len(users), drift)
+    if drift > float(settings.get('refit_drift', 0.2)):
+        return False
+
+    rows = clean_df(df, model.cluster_words_dict, model.km, changed_users, user_summary, labels=labels)
+    write_artifact(patch_csv(outfile, rows, users), artifact_dir)
+    model.update(changed_users, changed_reviews)
+    return True
+
+
+def main(df=None, user_summary=None):
+
+    random.seed(2)
+    print "Starting task to cluster data..."
+    stop = get_stop_words(stopwords.words('english'))
+    if df is None:
+        with metrics.stage('load_reviews') as stage:
+            df, user_summary = load_reviews()
+            stage.count('reviews', len(df))
+    outfile = os.path.join('customer_recommender', 'visualize', 'static', 'data.csv')
+    artifact_dir = os.path.join('customer_recommender', 'visualize', 'static', 'artifact')
+    model_path = settings.get('model_pickle', os.path.join('output', 'model.pickle'))
+
+    # a single grouped pass gives the corpus and the statistics of every user
+    with metrics.stage('summarize_users') as stage:
+        summary = summarize_users(df)
+        if user_summary is None:
+            user_summary = summary
+        user_df = create_user_df(df, summary)
+        stage.count('users', len(user_df))
+
+    # get list of users and reviews
+    users = user_df['user'].tolist()
+    reviews = user_df['reviews'].tolist()
+
+    # in incremental mode only the changed users are assigned, the model is refitted on a schedule or on drift
+    model = None
+    if settings.get('cluster_mode', 'full') == 'incremental' and os.path.exists(outfile):
+        model = load_model(model_path)
+    if model is not None and model.age() > float(settings.get('refit_days', 7)) * 86400:
+        print "Model is older than {0} days, refitting...".format(settings.get('refit_days', 7))
+        model = None
+    if model is not None:
+        with metrics.stage('assign') as stage:
+            patched = assign_changed_users(model, df, users, reviews, user_summary, outfile, artifact_dir)
+            stage.set('patched', patched)
+            if patched:
+                model.save(model_path)
+        if patched:
+            print "Output patched in {}".format(outfile)
+            return
+        print "Drift is above {0}, refitting...".format(settings.get('refit_drift', 0.2))
+
+    # tokenize every corpus once, the stem index and the vectorizer share the token streams
+    with metrics.stage('tokenize') as stage:
+        token_cache = TokenCache(settings.get('token_cache', os.path.join('output', 'tokens.pickle')))
+        key = corpora_key(reviews)
+        tokenized, stem_index = token_cache.load(key)
+        stage.set('cached', tokenized is not None)
+        if tokenized is None:
+            stem_index = StemIndex()
+            tokenized = tokenize_corpora(reviews, workers=int(settings.get('tokenize_workers', 1)), index=stem_index)
+            token_cache.save(key, tokenized, stem_index)
+        stem_index.save(settings.get('stem_index_path', os.path.join('output', 'stem_index.json')))
+        stage.count('users', len(tokenized))
+        stage.count('tokens', sum(len(stems) for tokens, stems in tokenized))
+        stage.count('stems', len(stem_index))
+        stage.set('stemmer_cache', STEMMER.stats())
+    if stage.fields['cached']:
+        print "Token streams reused from {0}".format(token_cache.path)
+    else:
+        print "Stemmer cache: {hits} hits, {misses} misses".format(**STEMMER.stats())
+
+    # tfidf
+    features = settings.get('features', 'tfidf')
+    with metrics.stage('features') as stage:
+        tfidf_vectorizer, tfidf_matrix = build_features(tokenized, stop, features)
+        terms = tfidf_vectorizer.get_feature_names()
+        stage.set('features', features)
+        stage.count('columns', tfidf_matrix.shape[1])
+    print "Features ({0}): {1} users x {2} columns in {3:.1f}s".format(features, tfidf_matrix.shape[0],
+                                                                       tfidf_matrix.shape[1], stage.seconds)
+
+    num_clusters = int(settings.get('num_clusters', 10))
+    engine = settings.get('cluster_engine', 'kmeans')
+
+    print "Performing k-means ({0})...".format(engine)
     # kmeans
-    km = KMeans(n_clusters=num_clusters, random_state=2)
-    km.fit(tfidf_matrix)
+    with metrics.stage('cluster', clusters=num_clusters) as stage:
+        stage.set('engine', engine)
+        km = fit_clusters(tfidf_matrix, num_clusters, engine=engine,
+                          batch_size=int(settings.get('cluster_batch_size', 1000)))
 
     # get cluster words
-    cluster_words_dict = get_cluster_words_dict(reviews, vocab_frame, km, num_clusters, terms)
-    # cluster_words_dict = manually_define_clusters()
-    final_df = clean_df(df, cluster_words_dict, km, users)
+    with metrics.stage('clean_df') as stage:
+        cluster_words_dict = get_cluster_words_dict(reviews, stem_index, km, num_clusters, terms,
+                                                    term_centers(tfidf_vectorizer, km.cluster_centers_))
+        # cluster_words_dict = manually_define_clusters()
+        final_df = clean_df(df, cluster_words_dict, km, users, user_summary)
+        stage.count('rows', len(final_df))
 
     print "Saving data..."
-    # save data to csv
-    outfile = os.path.join('customer_recommender', 'visualize', 'static', 'data.csv')
-    final_df.to_csv(outfile, index=False)
+    # save data to csv, and as the per-cluster slices the users endpoint loads
+    with metrics.stage('save') as stage:
+        final_df.to_csv(outfile, index=False)
+        index = write_artifact(final_df, artifact_dir)
+        stage.count('artifact_bytes', sum(cluster['bytes'] for cluster in index['clusters']))
+        ClusterModel.from_fit(tfidf_vectorizer, km, cluster_words_dict, users, reviews, tfidf_matrix).save(model_path)
     print "Output saved to {}".format(outfile)
+    print "Web page data saved to {0} ({1} clusters)".format(artifact_dir, len(index['clusters']))
+    print "Model saved to {}".format(model_path)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Clustering engines of the wrangle step and a sweep to choose the number of clusters.
+
+    $ python -m customer_recommender.wrangle.clustering 4 6 8 10 12 14
+"""
+
+import sys
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+ENGINES = ('kmeans', 'minibatch')
+
+
+def iter_chunks(matrix, chunk_size):
+    """Function to iterate over the rows of a (sparse) matrix in chunks
+
+    Args:
+        matrix (scipy.sparse.csr_matrix): The tf-idf matrix
+        chunk_size (int): Number of rows per chunk
+    Returns:
+        chunks (generator): Row slices of at most chunk_size rows
+
+    """
+    for start in range(0, matrix.shape[0], chunk_size):
+        yield matrix[start:start + chunk_size]
+
+
+def fit_clusters(matrix, num_clusters=10, engine='kmeans', batch_size=1000, epochs=3, random_state=2):
+    """Function to cluster the rows of the tf-idf matrix
+
+    The kmeans engine runs full batch k-means. The minibatch engine feeds the rows to
+    MiniBatchKMeans.partial_fit in chunks of batch_size rows, for a few epochs over the
+    chunks in random order, then labels every row chunk by chunk.
+
+    Args:
+        matrix (scipy.sparse.csr_matrix): The tf-idf matrix
+        num_clusters (int): Number of clusters
+        engine (str): 'kmeans' or 'minibatch'
+        batch_size (int): Number of rows per chunk of the minibatch engine
+        epochs (int): Number of passes over the chunks of the minibatch engine
+        random_state (int): Seed of the random generator
+    Returns:
+        km (KMeans): The fitted model, with labels_ set for every row
+
+    """
+    if engine not in ENGINES:
+        raise ValueError("Unknown clustering engine '{0}', expected one of {1}".format(engine, ', '.join(ENGINES)))
+
+    if engine == 'kmeans':
+        km = KMeans(n_clusters=num_clusters, random_state=random_state)
+        km.fit(matrix)
+        return km
+
+    # the first chunk initializes the centers, it needs at least one row per cluster
+    batch_size = max(batch_size, 3 * num_clusters)
+    km = MiniBatchKMeans(n_clusters=num_clusters, batch_size=batch_size, random_state=random_state)
+    rng = np.random.RandomState(random_state)
+    starts = np.arange(0, matrix.shape[0], batch_size)
+    for epoch in range(max(epochs, 1)):
+        if epoch:
+            rng.shuffle(starts)
+        for start in starts:
+            km.partial_fit(matrix[start:start + batch_size])
+    km.labels_ = np.concatenate([km.predict(chunk) for chunk in iter_chunks(matrix, batch_size)])
+    return km
+
+
+def sweep_k(matrix, ks, sample_size=2000, engine='minibatch', random_state=2):
+    """Function to score several numbers of clusters on a sample of the rows
+
+    Every candidate is fitted on the same random sample, the inertia per row and the
+    silhouette of the sample are reported, so k can be chosen without a full refit
+    for each candidate.
+
+    Args:
+        matrix (scipy.sparse.csr_matrix): The tf-idf matrix
+        ks (list): Candidate numbers of clusters
+        sample_size (int): Number of rows sampled
+        engine (str): 'kmeans' or 'minibatch'
+        random_state (int): Seed of the random generator
+    Returns:
+        scores (list): Dictionaries with the k, inertia and silhouette of every candidate
+
+    """
+    rng = np.random.RandomState(random_state)
+    n_rows = matrix.shape[0]
+    rows = np.sort(rng.choice(n_rows, min(sample_size, n_rows), replace=False))
+    sample = matrix[rows]
+
+    scores = []
+    for k in ks:
+        if k < 2 or k >= sample.shape[0]:
+            continue
+        km = fit_clusters(sample, k, engine=engine, random_state=random_state)
+        labels = km.labels_
+        # the silhouette is undefined when every row falls in one cluster
+        silhouette = silhouette_score(sample, labels, random_state=random_state) if len(set(labels)) > 1 else np.nan
+        scores.append({'k': k,
+                       'inertia': km.score(sample) / -float(sample.shape[0]),
+                       'silhouette': silhouette})
+    return scores
+
+
+def main(ks):
+    from customer_recommender.config import settings
+    from customer_recommender.wrangle.cluster_data import load_reviews, create_user_df, build_features, \
+        get_stop_words, stopwords
+    from customer_recommender.wrangle.tokens import tokenize_corpora
+
+    df, user_summary = load_reviews()
+    reviews = create_user_df(df)['reviews'].tolist()
+    tokenized = tokenize_corpora(reviews, workers=int(settings.get('tokenize_workers', 1)))
+    tfidf_vectorizer, tfidf_matrix = build_features(tokenized, get_stop_words(stopwords.words('english')),
+                                                    settings.get('features', 'tfidf'))
+
+    print "Scoring {0} users...".format(tfidf_matrix.shape[0])
+    scores = sweep_k(tfidf_matrix, ks,
+                     sample_size=int(settings.get('sweep_sample_size', 2000)),
+                     engine=settings.get('cluster_engine', 'kmeans'))
+    print "{0:>4} {1:>10} {2:>10}".format('k', 'inertia', 'silhouette')
+    for score in scores:
+        print "{k:>4} {inertia:10.4f} {silhouette:10.4f}".format(**score)
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or range(4, 21, 2))
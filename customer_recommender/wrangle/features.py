@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Memory bounded feature extraction: hashed n-gram counts reweighted by IDF, with an
+optional TruncatedSVD projection, as an alternative to the TfidfVectorizer whose
+vocabulary grows with the corpus.
+"""
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import Normalizer
+from sklearn.utils import murmurhash3_32
+from customer_recommender.wrangle.tokens import identity
+
+FEATURES = ('tfidf', 'hashing')
+
+
+class HashingFeatures(object):
+
+    """Hashed tf-idf features of pre-tokenized documents.
+
+    N-grams are hashed into n_features buckets, so no vocabulary is kept while
+    counting. Buckets outside the min_df and max_df document frequency bounds are
+    dropped, like the TfidfVectorizer does with terms, and the counts are reweighted by
+    IDF. With svd_components the rows are projected on that many SVD components and
+    normalized.
+
+    Only the buckets that are kept get a readable term, the first n-gram seen that
+    hashes into them, so the cluster terms can still be labelled.
+    """
+
+    def __init__(self, stop_words=None, ngram_range=(1, 3), n_features=2 ** 20, min_df=0.2, max_df=0.8,
+                 svd_components=0, random_state=2):
+        self.hasher = HashingVectorizer(tokenizer=identity,
+                                        preprocessor=identity,
+                                        lowercase=False,
+                                        stop_words=stop_words,
+                                        ngram_range=ngram_range,
+                                        n_features=n_features,
+                                        # scikit-learn 0.17 has no alternate_sign, colliding n-grams
+                                        # may cancel out before the absolute value is taken
+                                        non_negative=True,
+                                        norm=None)
+        self.n_features = n_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.svd_components = svd_components
+        self.random_state = random_state
+        self.buckets = None
+        self.terms = None
+        self.idf = None
+        self.svd = None
+        self.normalizer = None
+
+    def fit_transform(self, documents):
+
+        """Fits the document frequency mask, the IDF weights and the SVD projection.
+
+        Args:
+            documents (list): The stems of each user corpus
+        Returns:
+            matrix (scipy.sparse.csr_matrix): The features of each document, dense with svd_components.
+        """
+
+        counts = self.hasher.transform(documents)
+        n_documents = counts.shape[0]
+        df = np.bincount(counts.indices, minlength=self.n_features)
+        mask = (df >= self.min_df * n_documents) & (df <= self.max_df * n_documents) & (df > 0)
+        self.buckets = np.flatnonzero(mask)
+        self.terms = self._bucket_terms(documents)
+
+        counts = counts[:, self.buckets]
+        self.idf = TfidfTransformer()
+        matrix = self.idf.fit_transform(counts)
+        if self.svd_components:
+            self.svd = TruncatedSVD(n_components=min(self.svd_components, max(matrix.shape[1] - 1, 1)),
+                                    random_state=self.random_state)
+            self.normalizer = Normalizer(copy=False)
+            matrix = self.normalizer.fit_transform(self.svd.fit_transform(matrix))
+        return matrix
+
+    def transform(self, documents):
+        matrix = self.idf.transform(self.hasher.transform(documents)[:, self.buckets])
+        if self.svd is not None:
+            matrix = self.normalizer.transform(self.svd.transform(matrix))
+        return matrix
+
+    def _bucket_terms(self, documents):
+        """Maps the kept buckets to the first n-gram hashed into them"""
+
+        index = dict((bucket, i) for i, bucket in enumerate(self.buckets))
+        terms = [None] * len(self.buckets)
+        missing = len(terms)
+        analyze = self.hasher.build_analyzer()
+        for document in documents:
+            for term in analyze(document):
+                i = index.get(abs(murmurhash3_32(term, seed=0)) % self.n_features)
+                if i is not None and terms[i] is None:
+                    terms[i] = term
+                    missing -= 1
+            if not missing:
+                break
+        return terms
+
+    def get_feature_names(self):
+        return self.terms
+
+    def term_centers(self, centers):
+
+        """Maps cluster centers back to the kept buckets.
+
+        Args:
+            centers (numpy.ndarray): The cluster centers in feature space
+        Returns:
+            centers (numpy.ndarray): The cluster centers with a column per term of get_feature_names.
+        """
+
+        if self.svd is None:
+            return centers
+        return centers.dot(self.svd.components_)
+
+
+def term_centers(vectorizer, centers):
+    """Function to get the cluster centers with a column per term of vectorizer.get_feature_names()
+
+    Args:
+        vectorizer (TfidfVectorizer or HashingFeatures): The fitted vectorizer
+        centers (numpy.ndarray): The cluster centers
+    Returns:
+        centers (numpy.ndarray): The cluster centers in term space
+
+    """
+    if isinstance(vectorizer, HashingFeatures):
+        return vectorizer.term_centers(centers)
+    return centers
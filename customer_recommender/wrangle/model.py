@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+Persisted clustering model: the fitted vectorizer, the centroids and the labels of
+the clusters, with a hash of every user corpus so that a later run only assigns the
+users whose reviews changed.
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import cPickle as pickle
+import numpy as np
+import pandas as pd
+from ..helper import create_dir
+
+# bumped whenever the content of the model changes, older models are refitted
+MODEL_VERSION = 1
+
+
+def corpus_hash(text):
+    """Function to hash a user corpus
+
+    Args:
+        text (string): All the reviews for a single user concatenated into a single string
+    Returns:
+        digest (str): The sha1 hex digest of the corpus
+
+    """
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+
+class ClusterModel(object):
+
+    """The fitted tf-idf vectorizer and k-means model, the cluster labels and the users they were fitted on.
+
+    baseline is the mean distance of the fitted users to their centroid, the drift of
+    newly assigned users is measured against it.
+    """
+
+    def __init__(self, vectorizer, km, cluster_words_dict, user_hashes, baseline, fitted=None):
+        self.version = MODEL_VERSION
+        self.vectorizer = vectorizer
+        self.km = km
+        self.cluster_words_dict = cluster_words_dict
+        self.user_hashes = user_hashes
+        self.baseline = baseline
+        self.fitted = fitted or time.time()
+
+    @classmethod
+    def from_fit(klass, vectorizer, km, cluster_words_dict, users, reviews, matrix):
+        distances = km.transform(matrix).min(axis=1)
+        user_hashes = dict((user, corpus_hash(review)) for user, review in zip(users, reviews))
+        return klass(vectorizer, km, cluster_words_dict, user_hashes, float(np.mean(distances)))
+
+    def changed_users(self, users, reviews):
+
+        """Finds the users that are new or whose reviews changed since the model was saved.
+
+        Args:
+            users (list): List of users
+            reviews (list): The corpus of each user
+        Returns:
+            changed (list): Positions of the changed users in the lists.
+        """
+
+        return [i for i, (user, review) in enumerate(zip(users, reviews))
+                if self.user_hashes.get(user) != corpus_hash(review)]
+
+    def assign(self, documents):
+
+        """Assigns pre-tokenized user corpora to the nearest cluster.
+
+        Args:
+            documents (list): The stems of each user corpus
+        Returns:
+            labels (numpy.ndarray): The cluster of each user.
+            distances (numpy.ndarray): The distance of each user to its centroid.
+        """
+
+        if not documents:
+            return np.array([], dtype=int), np.array([])
+        distances = self.km.transform(self.vectorizer.transform(documents))
+        return distances.argmin(axis=1), distances.min(axis=1)
+
+    def drift(self, distances):
+
+        """Measures how much worse newly assigned users fit the clusters than the fitted ones.
+
+        Args:
+            distances (numpy.ndarray): The distance of each new user to its centroid
+        Returns:
+            drift (float): The relative increase of the mean distance over the baseline.
+        """
+
+        if not len(distances) or not self.baseline:
+            return 0.0
+        return float(np.mean(distances)) / self.baseline - 1
+
+    def age(self):
+        return time.time() - self.fitted
+
+    def update(self, users, reviews):
+        for user, review in zip(users, reviews):
+            self.user_hashes[user] = corpus_hash(review)
+
+    def save(self, path):
+
+        """Writes the model atomically, a crash never leaves a truncated model behind.
+
+        Args:
+            path (str): The path of the model pickle
+        Returns:
+            None
+        """
+
+        directory = os.path.dirname(path)
+        if directory:
+            create_dir(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outfile:
+            pickle.dump(self, outfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+
+
+def load_model(path):
+    """Function to load a saved model
+
+    Args:
+        path (str): The path of the model pickle
+    Returns:
+        model (ClusterModel): The saved model, or None if there is none or it has an older version
+
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as infile:
+        model = pickle.load(infile)
+    if getattr(model, 'version', None) != MODEL_VERSION:
+        return None
+    return model
+
+
+def patch_csv(path, rows, users):
+    """Function to replace the rows of some users in the saved cluster data
+
+    The rows that are kept stay in their order, every new row is inserted before the
+    first kept row of its cluster with a lower rating (or as many reviews and the same
+    rating), as clean_df orders them.
+
+    Args:
+        path (str): The path of data.csv
+        rows (pandas.DataFrame): The new rows, as returned by clean_df
+        users (list): The users to keep, rows of the other users are dropped
+    Returns:
+        df (pandas.DataFrame): The patched data
+
+    """
+    df = pd.read_csv(path)
+    keep = set('www.yelp.com' + user for user in users) - set(rows['user'])
+    kept = df[df['user'].isin(keep)].reset_index(drop=True)
+
+    cluster, rating, count = kept['cluster'].values, kept['avg_rating'].values, kept['num_reviews'].values
+    order = np.arange(len(kept), dtype=float)
+    new_order = []
+    for c, r, n in zip(rows['cluster'], rows['avg_rating'], rows['num_reviews']):
+        before = (cluster < c) | ((cluster == c) & ((rating > r) | ((rating == r) & (count >= n))))
+        new_order.append(before.sum() - 0.5)
+    df = pd.concat([kept, rows], ignore_index=True)[rows.columns]
+    df = df.iloc[np.argsort(np.concatenate([order, new_order]), kind='mergesort')]
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as outfile:
+        df.to_csv(outfile, index=False)
+    os.rename(tmp_path, path)
+    return df
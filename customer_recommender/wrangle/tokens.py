@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+"""
+Tokenization stage of the wrangle step: every user corpus is tokenized once, and the
+token streams feed both the stem index and the tf-idf vectorizer.
+"""
+
+import os
+import re
+import json
+import nltk
+import hashlib
+import tempfile
+import multiprocessing
+import cPickle as pickle
+from nltk.stem.snowball import SnowballStemmer
+from nltk.tokenize import wordpunct_tokenize
+from ..helper import create_dir
+
+# tokens without letters (e.g., numeric tokens, raw punctuation) are dropped
+LETTERS = re.compile('[a-zA-Z]')
+
+# bumped whenever tokenize changes, cached token streams of older versions are ignored
+TOKENIZER_VERSION = 1
+
+
+class CachedStemmer(object):
+
+    """Memoizes a stemmer, review vocabulary repeats heavily.
+
+    The cache holds at most max_size words and is emptied when it is full, so that
+    its memory stays bounded on very large corpora.
+    """
+
+    def __init__(self, stemmer=None, max_size=100000):
+        self.stemmer = stemmer or SnowballStemmer("english")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+
+    def stem(self, word):
+        try:
+            stem = self._cache[word]
+        except KeyError:
+            self.misses += 1
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+            stem = self._cache[word] = self.stemmer.stem(word)
+            return stem
+        self.hits += 1
+        return stem
+
+    def stats(self):
+        return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+STEMMER = CachedStemmer()
+
+
+class StemIndex(object):
+
+    """Maps every stem to its most frequent surface word.
+
+    Word counts are kept per stem and updated as corpora are tokenized, the most
+    frequent word of each stem is tracked along the way (the first one seen wins a
+    tie), so a lookup is a single dictionary access.
+    """
+
+    def __init__(self, counts=None, words=None):
+        self.counts = counts or {}
+        self.words = words or {}
+
+    def add(self, tokens, stems):
+
+        """Counts the surface words of a tokenized corpus.
+
+        Args:
+            tokens (list): The surface tokens of the corpus
+            stems (list): The stem of each token
+        Returns:
+            None
+        """
+
+        counts, words = self.counts, self.words
+        for token, stem in zip(tokens, stems):
+            word_counts = counts.get(stem)
+            if word_counts is None:
+                word_counts = counts[stem] = {}
+                words[stem] = token
+            count = word_counts[token] = word_counts.get(token, 0) + 1
+            if count > word_counts[words[stem]]:
+                words[stem] = token
+
+    def word(self, stem, default=None):
+        return self.words.get(stem, default)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, stem):
+        return stem in self.words
+
+    def save(self, path):
+
+        """Writes the index as JSON.
+
+        Args:
+            path (str): The path of the index file
+        Returns:
+            None
+        """
+
+        if os.path.dirname(path):
+            create_dir(os.path.dirname(path))
+        with open(path, 'w') as outfile:
+            json.dump({'words': self.words, 'counts': self.counts}, outfile)
+
+    @classmethod
+    def load(klass, path):
+        with open(path, 'r') as infile:
+            data = json.load(infile)
+        return klass(data['counts'], data['words'])
+
+
+def tokenize(text, stemmer=STEMMER):
+    """Function to tokenize a corpus once into its surface tokens and their stems
+
+    Args:
+        text (string): All the reviews for a single user concatenated into a single string
+        stemmer (Stemmer): The stemmer to be used
+    Returns:
+        tokens (list): The filtered, lowercased tokens
+        stems (list): The stem of each token
+
+    """
+    # first tokenize by sentence, then by word to ensure that punctuation is caught as it's own token
+    tokens = [word.lower() for sent in nltk.sent_tokenize(text) for word in wordpunct_tokenize(sent)
+              if LETTERS.search(word)]
+    # the snowball stemmer lowercases words itself, lowercased tokens share cache entries
+    stems = [stemmer.stem(token) for token in tokens]
+    return tokens, stems
+
+
+def tokenize_corpora(texts, stemmer=STEMMER, workers=1, chunksize=None, index=None):
+    """Function to tokenize every user corpus, optionally over a process pool
+
+    The corpora are split into chunks that worker processes tokenize and stem with their
+    own cached Snowball stemmer. Chunks come back in order, so the result is the same as
+    the serial one.
+
+    Args:
+        texts (list): The user corpora
+        stemmer (Stemmer): The stemmer to be used, worker processes always use the Snowball stemmer
+        workers (int): Number of worker processes (1 tokenizes in this process)
+        chunksize (int): Number of corpora per chunk, by default four chunks per worker
+        index (StemIndex): Optional stem index updated with the words of every corpus
+    Returns:
+        tokenized (list): (tokens, stems) of each corpus
+
+    """
+    if workers <= 1 or len(texts) < 2:
+        tokenized = []
+        for text in texts:
+            tokens, stems = tokenize(text, stemmer)
+            if index is not None:
+                index.add(tokens, stems)
+            tokenized.append((tokens, stems))
+        return tokenized
+
+    chunksize = chunksize or max(len(texts) // (workers * 4), 1)
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(_tokenize_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
+    tokenized = []
+    for chunk, hits, misses in results:
+        tokenized.extend(chunk)
+        if index is not None:
+            for tokens, stems in chunk:
+                index.add(tokens, stems)
+        if isinstance(stemmer, CachedStemmer):
+            stemmer.hits += hits
+            stemmer.misses += misses
+    return tokenized
+
+
+def _tokenize_chunk(texts):
+    """Function run by the worker processes, returns the chunk and its stemmer cache counters"""
+    hits, misses = STEMMER.hits, STEMMER.misses
+    tokenized = [tokenize(text) for text in texts]
+    return tokenized, STEMMER.hits - hits, STEMMER.misses - misses
+
+
+def identity(tokens):
+    """Function passed as the vectorizer preprocessor and tokenizer of pre-tokenized documents"""
+    return tokens
+
+
+def corpora_key(texts):
+    """Function to hash the user corpora and the tokenizer version into a token cache key
+
+    Args:
+        texts (list): The user corpora
+    Returns:
+        key (str): The sha1 hex digest
+
+    """
+    digest = hashlib.sha1('tokenizer-{0}'.format(TOKENIZER_VERSION))
+    for text in texts:
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        digest.update(hashlib.sha1(text).digest())
+    return digest.hexdigest()
+
+
+class TokenCache(object):
+
+    """The token streams and stem index of the last corpora tokenized, keyed by corpora_key."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, key):
+
+        """Reads the cached token streams.
+
+        Args:
+            key (str): The corpora_key of the user corpora
+        Returns:
+            tokenized (list): (tokens, stems) of each corpus, or None when the cache is for other corpora.
+            stem_index (StemIndex): The stem index of the corpora, or None.
+        """
+
+        if not self.path or not os.path.exists(self.path):
+            return None, None
+        with open(self.path, 'rb') as infile:
+            cached = pickle.load(infile)
+        if cached.get('key') != key:
+            return None, None
+        return cached['tokenized'], cached['stem_index']
+
+    def save(self, key, tokenized, stem_index):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            create_dir(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outfile:
+            pickle.dump({'key': key, 'tokenized': tokenized, 'stem_index': stem_index}, outfile,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
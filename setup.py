@@ -61,10 +61,12 @@ config = {
     "author_email": "jason.s.keung@gmail.com",
     "url": "https://github.com/jkeung/Customer_Recommender",
     "packages": packages,
+    "package_data": {'customer_recommender.visualize': ['templates/*', 'static/*', 'static/artifact/*']},
     # "package_dir": {'': '.'},
     "install_requires": requirements,
     "zip_safe": False,
     "scripts": [],
+    "entry_points": {'console_scripts': ['customer-recommender = customer_recommender.cli:main']},
     "cmdclass":{'install': my_install,  # override install
                 'develop': my_develop}  # develop is used for pip install -e .
     }